@@ -1,15 +1,20 @@
 from __future__ import annotations
 
 from .hex import Color, Direction, HException, Hex, Location, Piece
-from math import sqrt, sin, cos, pi
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from functools import lru_cache
+from math import ceil, floor, sqrt, sin, cos, pi
+from time import perf_counter
 from pygame import gfxdraw
 from pygame import freetype
-from typing import List, Optional, TYPE_CHECKING, Tuple
+from typing import Iterator, List, Optional, TYPE_CHECKING, Tuple
 
+import os
 import pygame
 
 if TYPE_CHECKING:
-    from .hive import Hive
+    from .hive import Hive, Stacks
 
 
 WHITE = (255, 255, 255)
@@ -20,15 +25,75 @@ BLUE = (0, 0, 255)
 SCROLL_SPEED = 4
 ZOOM_SPEED = 2
 
+STATIC = os.path.join(os.path.dirname(__file__), "static")
+
+FONT = os.path.join(STATIC, "fonts", "arial.ttf")
+
 IMAGES = {
-    Piece.QUEEN: "hive/static/pieces/queen.png",
-    Piece.ANT: "hive/static/pieces/ant.png",
-    Piece.BEETLE: "hive/static/pieces/beetle.png",
-    Piece.GRASSHOPPER: "hive/static/pieces/grasshopper.png",
-    Piece.SPIDER: "hive/static/pieces/spider.png",
+    Piece.QUEEN: os.path.join(STATIC, "pieces", "queen.png"),
+    Piece.ANT: os.path.join(STATIC, "pieces", "ant.png"),
+    Piece.BEETLE: os.path.join(STATIC, "pieces", "beetle.png"),
+    Piece.GRASSHOPPER: os.path.join(STATIC, "pieces", "grasshopper.png"),
+    Piece.SPIDER: os.path.join(STATIC, "pieces", "spider.png"),
 }
 
 
+@lru_cache(maxsize=None)
+def load_image(piece: Piece) -> pygame.Surface:
+    return pygame.image.load(IMAGES[piece])
+
+
+@lru_cache(maxsize=256)
+def load_sprite(piece: Piece, width: int, height: int) -> pygame.Surface:
+    """The image for a piece scaled to the given size, cached across frames"""
+    return pygame.transform.scale(load_image(piece), (width, height))
+
+
+@dataclass
+class Viewport:
+    """The range of cube coordinates visible on a screen of the given size"""
+
+    center: Tuple[float, float]
+    radius: float
+    width: int
+    height: int
+
+    @property
+    def row_range(self) -> range:
+        """Rows (z coordinates) with at least part of a hex on screen"""
+        _, center_y = self.center
+        # Rows are 3/2 radius apart and hexes extend one radius either side
+        spacing = 3 / 2 * self.radius
+        return range(
+            floor((-self.radius - center_y) / spacing),
+            ceil((self.height + self.radius - center_y) / spacing) + 1,
+        )
+
+    def column_range(self, z: int) -> range:
+        """Values of x with at least part of a hex on screen in the given row"""
+        center_x, _ = self.center
+        spacing = sqrt(3) * self.radius
+        return range(
+            floor((-self.radius - center_x) / spacing - z / 2),
+            ceil((self.width + self.radius - center_x) / spacing - z / 2) + 1,
+        )
+
+    @property
+    def num_locations(self) -> int:
+        return sum(len(self.column_range(z)) for z in self.row_range)
+
+    @property
+    def locations(self) -> Iterator[Location]:
+        for z in self.row_range:
+            for x in self.column_range(z):
+                yield Location(x, -(x + z), z)
+
+    def __contains__(self, location: Location) -> bool:
+        return location.z in self.row_range and location.x in self.column_range(
+            location.z
+        )
+
+
 class Draw:
     def __init__(self, hive: Hive):
         self.hive = hive
@@ -41,15 +106,14 @@ class Draw:
         x, y = hex.location.to_pixel
         x = self.radius * x + center_x
         y = self.radius * y + center_y
-        img = pygame.image.load(IMAGES[hex.piece])
-        img_rect = img.get_rect()
+        img_rect = load_image(hex.piece).get_rect()
         max_dim = max(img_rect.width, img_rect.height)
         img_width = 1.3 * self.radius * img_rect.width / max_dim
         img_height = 1.3 * self.radius * img_rect.height / max_dim
         img_rect = pygame.Rect(
             x - img_width / 2, y - img_height / 2, x + img_width / 2, y + img_height / 2
         )
-        img = pygame.transform.scale(img, (int(img_width), int(img_height)))
+        img = load_sprite(hex.piece, int(img_width), int(img_height))
         args = [
             self.screen,
             [
@@ -79,15 +143,14 @@ class Draw:
             - 0.45 * self.radius
             + 2 * idx * (preview_radius + 1)
         )
-        img = pygame.image.load(IMAGES[hex.piece])
-        img_rect = img.get_rect()
+        img_rect = load_image(hex.piece).get_rect()
         max_dim = max(img_rect.width, img_rect.height)
         img_width = 0.3 * self.radius * img_rect.width / max_dim
         img_height = 0.3 * self.radius * img_rect.height / max_dim
         img_rect = pygame.Rect(
             x - img_width / 2, y - img_height / 2, x + img_width / 2, y + img_height / 2
         )
-        img = pygame.transform.scale(img, (int(img_width), int(img_height)))
+        img = load_sprite(hex.piece, int(img_width), int(img_height))
         args = [
             self.screen,
             [
@@ -130,9 +193,10 @@ class Draw:
     def highlight_selected_hex(self):
         self.highlight_hex_at_location(self.selected_hex.location, RED)
 
-    def highlight_possible_moves(self):
+    def highlight_possible_moves(self, viewport: Viewport):
         for location in self.possible_moves:
-            self.highlight_hex_at_location(location, BLUE)
+            if location in viewport:
+                self.highlight_hex_at_location(location, BLUE)
 
     def draw_number_on_hex(self, number: int, hex: Hex):
         if hex.color == Color.WHITE:
@@ -160,11 +224,41 @@ class Draw:
         location = self.mouse_position_to_location(mouse_position)
         return self.hive.get_top_hex_by_location(location)
 
+    @property
+    def viewport(self) -> Viewport:
+        return Viewport(
+            self.center, self.radius, self.screen.get_width(), self.screen.get_height()
+        )
+
+    def visible_stacks(self, viewport: Viewport) -> Iterator[List[Hex]]:
+        """Stacks of hexes on screen, bottom first.
+
+        Whichever is smaller of the visible cells and the occupied cells is
+        scanned, so the cost is bounded by the size of the screen rather than
+        the size of the board.
+        """
+        location_to_hex = self.hive.location_to_hex
+        if viewport.num_locations < len(location_to_hex):
+            for location in viewport.locations:
+                hexes = location_to_hex.get(location)
+                if hexes:
+                    yield hexes
+        else:
+            for location, hexes in list(location_to_hex.items()):
+                if hexes and location in viewport:
+                    yield hexes
+
+    def draw_board(self, viewport: Viewport):
+        for hexes in self.visible_stacks(viewport):
+            self.draw_hex(hexes[-1])
+            if len(hexes) > 1:
+                self.draw_number_on_hex(len(hexes) - 1, hexes[-1])
+
     def draw_hive(self):
         pygame.init()
         pygame.display.set_caption("Hive")
 
-        self.font = freetype.Font("hive/static/fonts/arial.ttf", 10)
+        self.font = freetype.Font(FONT, 10)
 
         infoObject = pygame.display.Info()
         self.screen = pygame.display.set_mode(
@@ -241,17 +335,15 @@ class Draw:
 
             self.screen.fill(WHITE)
 
-            for hex in self.hive.all_hexes:
-                if hex.is_on_top:
-                    self.draw_hex(hex)
-                if hex.is_on_top and hex.has_pieces_beneath:
-                    self.draw_number_on_hex(hex.num_pieces_beneath, hex)
+            viewport = self.viewport
+            self.draw_board(viewport)
 
             if self.selected_hex is not None:
                 self.highlight_selected_hex()
-                self.highlight_possible_moves()
+                self.highlight_possible_moves(viewport)
 
             # Hover over beetle
+            mouse_position = pygame.mouse.get_pos()
             try:
                 hex: Hex = self.mouse_position_to_hex(mouse_position)
                 if hex.piece == Piece.BEETLE:
@@ -261,3 +353,71 @@ class Draw:
                 pass
 
             pygame.display.flip()
+
+
+def hexagon_stacks(size: int) -> Stacks:
+    """A board filling every location within the given distance of the origin"""
+    pieces = list(Piece)
+    stacks = {}
+    for x in range(-size, size + 1):
+        for z in range(max(-size, -x - size), min(size, -x + size) + 1):
+            idx = len(stacks)
+            stacks[Location(x, -(x + z), z)] = [
+                (pieces[idx % len(pieces)], list(Color)[idx % 2])
+            ]
+    return stacks
+
+
+def benchmark(sizes: List[int], width: int, height: int, radius: int, frames: int):
+    """Time culling and drawing one screen of a board as the board grows"""
+    from .hive import Hive
+
+    freetype.init()
+    for size in sizes:
+        drawer = Draw(Hive.from_stacks(hexagon_stacks(size)))
+        drawer.screen = pygame.Surface((width, height))
+        drawer.center = width / 2, height / 2
+        drawer.radius = radius
+        drawer.font = freetype.Font(FONT, 0.15 * radius)
+        viewport = drawer.viewport
+
+        start = perf_counter()
+        for _ in range(frames):
+            num_visible = sum(1 for _ in drawer.visible_stacks(viewport))
+        cull = (perf_counter() - start) / frames
+
+        start = perf_counter()
+        for _ in range(frames):
+            [
+                hexes
+                for location, hexes in drawer.hive.location_to_hex.items()
+                if location in viewport
+            ]
+        brute_force = (perf_counter() - start) / frames
+
+        start = perf_counter()
+        for _ in range(frames):
+            drawer.screen.fill(WHITE)
+            drawer.draw_board(viewport)
+        frame = (perf_counter() - start) / frames
+
+        print(
+            f"{len(drawer.hive.location_to_hex)} pieces, {num_visible} visible:"
+            f" cull {1e6 * cull:.0f}us (brute force {1e6 * brute_force:.0f}us),"
+            f" frame {1000 * frame:.2f}ms"
+        )
+
+
+def main():
+    parser = ArgumentParser(description="Time drawing a screen of ever larger boards")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 16, 64, 256])
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--radius", type=int, default=40)
+    parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+    benchmark(args.sizes, args.width, args.height, args.radius, args.frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""Differential fuzzing of move generators.
+
+Random legal games are played out and, at every ply, the moves produced by a
+candidate generator are compared against the reference rules in ``hex.py`` for
+every hex on top of the hive, or a random sample of them with ``--sample``.
+Failing positions are shrunk to a minimal reproduction before being reported.
+Games are independent and can be spread over processes with ``--workers``.
+
+Run with ``python -m hive.fuzz --candidate some.module:generator``.
+"""
+
+from __future__ import annotations
+
+from .game import STARTING_HAND, placement_locations
+from .hex import Color, Direction, Hex, Location, Piece
+from .hive import Hive, MoveCache, Stacks
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from importlib import import_module
+from itertools import islice
+from random import Random
+from time import perf_counter, time
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+
+Generator = Callable[[Hex], Set[Location]]
+
+# Either the locations a hex may move to or the name of the exception raised.
+# Generators which leave the board modified, or answer differently when asked
+# again, are flagged as such.
+Outcome = Union[FrozenSet[Location], str, Tuple[str, object]]
+
+
+def reference_generator(hex: Hex) -> Set[Location]:
+    return hex.generate_moveable_locations()
+
+
+def cached_generator(hex: Hex) -> Set[Location]:
+    return hex.moveable_locations
+
+
+def load_generator(path: str) -> Generator:
+    """Load a generator given as ``package.module:function``"""
+    module_name, _, attribute = path.partition(":")
+    return getattr(import_module(module_name), attribute)
+
+
+def copy_stacks(stacks: Stacks) -> Stacks:
+    return {location: list(stack) for location, stack in stacks.items()}
+
+
+def is_connected(stacks: Stacks) -> bool:
+    """Whether every occupied location can be reached from every other one"""
+    if not stacks:
+        return True
+    start = next(iter(stacks))
+    visited = {start}
+    frontier = [start]
+    while frontier:
+        location = frontier.pop()
+        for direction in Direction:
+            neighbor = location + direction
+            if neighbor in stacks and neighbor not in visited:
+                visited.add(neighbor)
+                frontier.append(neighbor)
+    return len(visited) == len(stacks)
+
+
+def outcome_at(
+    generator: Generator, hive: Hive, location: Location, repeat: int = 1
+) -> Outcome:
+    """Run the generator for the top hex at the location, repeat times.
+
+    Repeating catches generators whose answer changes once it is cached.
+    Outcomes of generators that modified the hive are flagged, in which case the
+    hive must be rebuilt before it is used again. Modifications are spotted from
+    the Zobrist key, so only those made through the hive's methods are caught.
+    """
+    key, num_hexes = hive.zobrist_key, len(hive.hex_to_location)
+    hex = hive.get_top_hex_by_location(location)
+    results: List[Outcome] = []
+    for _ in range(repeat):
+        try:
+            results.append(frozenset(generator(hex)))
+        except Exception as e:
+            results.append(type(e).__name__)
+        if (hive.zobrist_key, len(hive.hex_to_location)) != (key, num_hexes):
+            return ("mutated", results[-1])
+    if any(outcome != results[0] for outcome in results):
+        return ("inconsistent", tuple(results))
+    return results[0]
+
+
+def outcomes(
+    generator: Generator,
+    hive: Hive,
+    locations: Iterable[Location],
+    repeat: int = 1,
+) -> Tuple[Dict[Location, Outcome], Hive]:
+    """Run the generator for the top hex at each location.
+
+    The hive is returned along with the outcomes, rebuilt if it was modified.
+    """
+    stacks = hive.stacks
+    results = {}
+    for location in locations:
+        results[location] = outcome_at(generator, hive, location, repeat)
+        if isinstance(results[location], tuple) and results[location][0] == "mutated":
+            hive = Hive.from_stacks(stacks, move_cache=hive.move_cache)
+    return results, hive
+
+
+def apply_move(
+    hive: Hive,
+    piece: Piece,
+    color: Color,
+    origin: Optional[Location],
+    destination: Location,
+):
+    """Place a new piece or move the top hex at the origin"""
+    if origin is None:
+        hive.create_hex(piece, color, destination)
+    else:
+        hex = hive.get_top_hex_by_location(origin)
+        hive.remove_hex(hex)
+        hive.place_hex(hex, destination)
+
+
+@dataclass
+class Failure:
+    stacks: Stacks
+    location: Location
+    expected: Outcome
+    actual: Outcome
+
+    def to_hive(self) -> Hive:
+        return Hive.from_stacks(self.stacks)
+
+    def __str__(self) -> str:
+        lines = [f"Generators disagree for the hex at {self.location}:"]
+        for location, stack in self.stacks.items():
+            pieces = ", ".join(f"{color.name} {piece.name}" for piece, color in stack)
+            lines.append(f"    {location}: {pieces}")
+        lines.append(f"  expected: {_format_outcome(self.expected)}")
+        lines.append(f"  actual:   {_format_outcome(self.actual)}")
+        return "\n".join(lines)
+
+
+def _format_outcome(outcome: Outcome) -> str:
+    if isinstance(outcome, frozenset):
+        return "{" + ", ".join(sorted(str(location) for location in outcome)) + "}"
+    if isinstance(outcome, tuple) and outcome[0] == "inconsistent":
+        return " then ".join(_format_outcome(result) for result in outcome[1])
+    if isinstance(outcome, tuple):
+        return f"{_format_outcome(outcome[1])} (board was modified)"
+    return f"raised {outcome}"
+
+
+def _disagree(
+    reference: Generator,
+    candidate: Generator,
+    stacks: Stacks,
+    location: Location,
+    repeat: int = 1,
+) -> Optional[Tuple[Outcome, Outcome]]:
+    expected = outcome_at(reference, Hive.from_stacks(stacks), location)
+    actual = outcome_at(candidate, Hive.from_stacks(stacks), location, repeat)
+    if expected != actual:
+        return expected, actual
+    return None
+
+
+def _smaller_positions(stacks: Stacks, location: Location):
+    """Positions with one piece or stack fewer which still contain the target"""
+    for other, stack in stacks.items():
+        if other == location:
+            if len(stack) > 1:
+                for idx in range(len(stack) - 1):
+                    smaller = copy_stacks(stacks)
+                    del smaller[other][idx]
+                    yield smaller
+            continue
+        smaller = copy_stacks(stacks)
+        del smaller[other]
+        yield smaller
+        if len(stack) > 1:
+            smaller = copy_stacks(stacks)
+            smaller[other].pop()
+            yield smaller
+
+
+def shrink(
+    reference: Generator, candidate: Generator, failure: Failure, repeat: int = 1
+) -> Failure:
+    """Greedily remove pieces while the generators still disagree"""
+    improved = True
+    while improved:
+        improved = False
+        for smaller in _smaller_positions(failure.stacks, failure.location):
+            if not is_connected(smaller):
+                continue
+            disagreement = _disagree(
+                reference, candidate, smaller, failure.location, repeat
+            )
+            if disagreement is not None:
+                failure = Failure(smaller, failure.location, *disagreement)
+                improved = True
+                break
+    return failure
+
+
+@dataclass
+class FuzzReport:
+    games: int = 0
+    plies: int = 0
+    comparisons: int = 0
+    elapsed: float = 0.0
+    failures: List[Failure] = field(default_factory=list)
+    # Lookups in the candidate hive's move cache, if the candidate uses it
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    @property
+    def games_per_minute(self) -> float:
+        return 60 * self.games / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def plies_per_second(self) -> float:
+        return self.plies / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def comparisons_per_second(self) -> float:
+        return self.comparisons / self.elapsed if self.elapsed else 0.0
+
+    def merge(self, other: FuzzReport):
+        """Add the counts and failures of another report, leaving elapsed alone"""
+        self.games += other.games
+        self.plies += other.plies
+        self.comparisons += other.comparisons
+        self.failures.extend(other.failures)
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.games} games, {self.plies} plies, {self.comparisons} comparisons"
+            f" in {self.elapsed:.2f}s",
+            f"{self.games_per_minute:.0f} games/min, {self.plies_per_second:.0f}"
+            f" plies/s, {self.comparisons_per_second:.0f} comparisons/s",
+            f"move cache: {self.cache_hits} hits, {self.cache_misses} misses",
+            f"{len(self.failures)} failures",
+        ]
+        lines.extend(str(failure) for failure in self.failures)
+        return "\n".join(lines)
+
+
+class Fuzzer:
+    def __init__(
+        self,
+        candidate: Generator,
+        reference: Generator = reference_generator,
+        seed: Optional[int] = None,
+        max_plies: int = 30,
+        sample: Optional[int] = None,
+        repeat: int = 2,
+    ):
+        self.candidate = candidate
+        self.reference = reference
+        self.random = Random(seed)
+        self.max_plies = max_plies
+        # Hexes compared per ply if set, rather than every hex on top of the hive
+        self.sample = sample
+        # Times the candidate is asked for each hex, so that cached generators
+        # are checked on hits as well as misses
+        self.repeat = repeat
+
+    def check(
+        self,
+        reference_hive: Hive,
+        candidate_hive: Hive,
+        locations: List[Location],
+        report: FuzzReport,
+    ) -> Tuple[Dict[Location, Outcome], Hive, Hive]:
+        """Compare both generators on a position.
+
+        The reference moves are returned along with both hives, which are
+        rebuilt if a generator modified them.
+        """
+        expected, reference_hive = outcomes(self.reference, reference_hive, locations)
+        actual, candidate_hive = outcomes(
+            self.candidate, candidate_hive, locations, self.repeat
+        )
+        report.comparisons += len(expected)
+        for location in locations:
+            if expected[location] != actual[location]:
+                failure = Failure(
+                    reference_hive.stacks,
+                    location,
+                    expected[location],
+                    actual[location],
+                )
+                report.failures.append(
+                    shrink(self.reference, self.candidate, failure, self.repeat)
+                )
+                break
+        return expected, reference_hive, candidate_hive
+
+    def play_game(
+        self, report: FuzzReport, seed: int, deadline: Optional[float] = None
+    ) -> bool:
+        """Play one random game, returning whether it ran to completion.
+
+        The deadline is a ``time.time()``, so that it holds across processes.
+        """
+        random = Random(seed)
+        reference_hive = Hive(draw=False)
+        # Kept for the whole game, including when the hive is rebuilt
+        move_cache = MoveCache()
+        candidate_hive = Hive(draw=False, move_cache=move_cache)
+        try:
+            return self._play_game(
+                report, random, reference_hive, candidate_hive, deadline
+            )
+        finally:
+            report.cache_hits += move_cache.hits
+            report.cache_misses += move_cache.misses
+
+    def _play_game(
+        self,
+        report: FuzzReport,
+        random: Random,
+        reference_hive: Hive,
+        candidate_hive: Hive,
+        deadline: Optional[float],
+    ) -> bool:
+        hands = {color: dict(STARTING_HAND) for color in Color}
+        placed = {color: 0 for color in Color}
+        num_failures = len(report.failures)
+        for ply in range(self.max_plies):
+            if deadline is not None and time() >= deadline:
+                return False
+            color = Color.WHITE if ply % 2 == 0 else Color.BLACK
+            stacks = reference_hive.stacks
+            locations = list(stacks)
+            if self.sample is not None and len(locations) > self.sample:
+                locations = random.sample(locations, self.sample)
+            moves, reference_hive, candidate_hive = self.check(
+                reference_hive, candidate_hive, locations, report
+            )
+            report.plies += 1
+            if len(report.failures) > num_failures:
+                return True
+            actions = []
+            hand = hands[color]
+            pieces = [piece for piece, count in hand.items() if count]
+            if placed[color] == 3 and hand[Piece.QUEEN]:
+                pieces = [Piece.QUEEN]
+            for location in placement_locations(stacks, color):
+                for piece in pieces:
+                    actions.append((piece, None, location))
+            if not hand[Piece.QUEEN]:
+                for origin, outcome in moves.items():
+                    if stacks[origin][-1][1] != color:
+                        continue
+                    if isinstance(outcome, frozenset):
+                        for destination in outcome:
+                            actions.append((None, origin, destination))
+            if not actions:
+                continue
+            piece, origin, destination = random.choice(actions)
+            if origin is None:
+                hand[piece] -= 1
+                placed[color] += 1
+            else:
+                piece, _ = stacks[origin][-1]
+            for hive in (reference_hive, candidate_hive):
+                apply_move(hive, piece, color, origin, destination)
+        return True
+
+    def run(
+        self,
+        games: Optional[int] = None,
+        duration: Optional[float] = None,
+        workers: int = 1,
+    ) -> FuzzReport:
+        """Play games until either limit is reached, across worker processes.
+
+        Every game gets its own seed drawn from the fuzzer's, so a run plays the
+        same games however many workers share them. The duration is also checked
+        between plies, and a game cut short by it is not counted.
+        """
+        start = perf_counter()
+        deadline = time() + duration if duration is not None else None
+        if games is None and duration is None:
+            games = 1
+        seeds = iter(lambda: self.random.getrandbits(64), None)
+        if games is not None:
+            seeds = islice(seeds, games)
+        report = FuzzReport()
+        if workers <= 1:
+            for seed in seeds:
+                game = fuzz_game(self, seed, deadline)
+                report.merge(game)
+                if not game.games:
+                    break
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                pending = {
+                    executor.submit(fuzz_game, self, seed, deadline)
+                    for seed in islice(seeds, workers)
+                }
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        game = future.result()
+                        report.merge(game)
+                        seed = next(seeds, None) if game.games else None
+                        if seed is not None:
+                            pending.add(
+                                executor.submit(fuzz_game, self, seed, deadline)
+                            )
+        report.elapsed = perf_counter() - start
+        return report
+
+
+def fuzz_game(fuzzer: Fuzzer, seed: int, deadline: Optional[float]) -> FuzzReport:
+    """Report for a single game, counted only if it ran to completion"""
+    report = FuzzReport()
+    if fuzzer.play_game(report, seed, deadline):
+        report.games = 1
+    return report
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--candidate",
+        default="hive.fuzz:cached_generator",
+        help="generator to test, given as package.module:function",
+    )
+    parser.add_argument(
+        "--reference",
+        default="hive.fuzz:reference_generator",
+        help="generator to test against, given as package.module:function",
+    )
+    parser.add_argument("--games", type=int, default=None)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--max-plies", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=2,
+        help="times the candidate is asked for each hex",
+    )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=0,
+        help="compare only this many random hexes per ply instead of every hex",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes playing games at once"
+    )
+    args = parser.parse_args()
+
+    fuzzer = Fuzzer(
+        load_generator(args.candidate),
+        reference=load_generator(args.reference),
+        seed=args.seed,
+        max_plies=args.max_plies,
+        sample=args.sample or None,
+        repeat=args.repeat,
+    )
+    report = fuzzer.run(
+        games=args.games, duration=args.duration, workers=args.workers
+    )
+    print(report)
+    if report.failures:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
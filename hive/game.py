@@ -0,0 +1,251 @@
+"""Turn order, hands and placement rules for a base game of Hive.
+
+Pieces are labelled as in the Universal Hive Protocol: the color letter, the
+piece letter and, for pieces with more than one copy, their number (``wQ``,
+``bA2``).
+"""
+
+from __future__ import annotations
+
+from .hex import Color, Direction, HException, Hex, Location, Piece
+from .hive import Hive, MoveCache, Stacks
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Dict, List, Optional, Set, Tuple
+
+
+STARTING_HAND = {
+    Piece.QUEEN: 1,
+    Piece.ANT: 3,
+    Piece.SPIDER: 2,
+    Piece.BEETLE: 2,
+    Piece.GRASSHOPPER: 3,
+}
+
+ORIGIN = Location(0, 0, 0)
+
+WIN_SCORE = 1000
+
+PIECE_LETTERS = {piece: piece.name[0] for piece in Piece}
+
+COLOR_LETTERS = {color: color.name[0].lower() for color in Color}
+
+
+class GameState(Enum):
+    NOT_STARTED = auto()
+    IN_PROGRESS = auto()
+    DRAW = auto()
+    WHITE_WINS = auto()
+    BLACK_WINS = auto()
+
+
+@dataclass(frozen=True)
+class Move:
+    label: str
+    destination: Optional[Location]
+
+    @property
+    def is_pass(self) -> bool:
+        return self.destination is None
+
+
+PASS = Move("pass", None)
+
+
+def make_label(piece: Piece, color: Color, number: int) -> str:
+    label = COLOR_LETTERS[color] + PIECE_LETTERS[piece]
+    if STARTING_HAND[piece] > 1:
+        label += str(number)
+    return label
+
+
+def parse_label(label: str) -> Tuple[Piece, Color]:
+    colors = {letter: color for color, letter in COLOR_LETTERS.items()}
+    pieces = {letter: piece for piece, letter in PIECE_LETTERS.items()}
+    try:
+        color = colors[label[0]]
+        piece = pieces[label[1]]
+        number = int(label[2:]) if label[2:] else 1
+    except (IndexError, KeyError, ValueError):
+        raise HException(f"Invalid piece {label!r}.")
+    if label != make_label(piece, color, number) or number > STARTING_HAND[piece]:
+        raise HException(f"Invalid piece {label!r}.")
+    return piece, color
+
+
+def placement_locations(stacks: Stacks, color: Color) -> Set[Location]:
+    """Empty locations where a new piece of the given color may be placed"""
+    if not stacks:
+        return {ORIGIN}
+    empty = {
+        location + direction
+        for location in stacks
+        for direction in Direction
+        if location + direction not in stacks
+    }
+    if len(stacks) == 1:
+        return empty
+    locations = set()
+    for location in empty:
+        neighbor_colors = {
+            stacks[location + direction][-1][1]
+            for direction in Direction
+            if location + direction in stacks
+        }
+        if neighbor_colors == {color}:
+            locations.add(location)
+    return locations
+
+
+class Game:
+    def __init__(self, move_cache: Optional[MoveCache] = None):
+        self.hive = Hive(draw=False, move_cache=move_cache)
+        self.hands = {color: dict(STARTING_HAND) for color in Color}
+        self.hexes: Dict[str, Hex] = {}
+        self.labels: Dict[Hex, str] = {}
+        # Each move played along with where the piece moved from
+        self.history: List[Tuple[Move, Optional[Location]]] = []
+        # Valid moves for the position after each move, filled in lazily
+        self._valid_moves: List[Optional[List[Move]]] = [None]
+
+    @property
+    def ply(self) -> int:
+        return len(self.history)
+
+    @property
+    def turn_color(self) -> Color:
+        return Color.WHITE if self.ply % 2 == 0 else Color.BLACK
+
+    @property
+    def turn_number(self) -> int:
+        return self.ply // 2 + 1
+
+    def queen(self, color: Color) -> Optional[Hex]:
+        return self.hexes.get(make_label(Piece.QUEEN, color, 1))
+
+    def queen_neighbors(self, color: Color) -> int:
+        queen = self.queen(color)
+        if queen is None:
+            return 0
+        location = queen.location
+        return sum(
+            self.hive.location_is_occupied(location + direction)
+            for direction in Direction
+        )
+
+    @property
+    def state(self) -> GameState:
+        if not self.history:
+            return GameState.NOT_STARTED
+        white_surrounded = self.queen_neighbors(Color.WHITE) == len(Direction)
+        black_surrounded = self.queen_neighbors(Color.BLACK) == len(Direction)
+        if white_surrounded and black_surrounded:
+            return GameState.DRAW
+        if white_surrounded:
+            return GameState.BLACK_WINS
+        if black_surrounded:
+            return GameState.WHITE_WINS
+        return GameState.IN_PROGRESS
+
+    @property
+    def is_over(self) -> bool:
+        return self.state in (
+            GameState.DRAW,
+            GameState.WHITE_WINS,
+            GameState.BLACK_WINS,
+        )
+
+    def pieces_in_hand(self, color: Color) -> List[Piece]:
+        hand = self.hands[color]
+        num_placed = sum(STARTING_HAND.values()) - sum(hand.values())
+        if hand[Piece.QUEEN] and num_placed == 3:
+            return [Piece.QUEEN]
+        return [
+            piece
+            for piece, count in hand.items()
+            if count and not (piece == Piece.QUEEN and num_placed == 0)
+        ]
+
+    def next_label(self, piece: Piece, color: Color) -> str:
+        number = STARTING_HAND[piece] - self.hands[color][piece] + 1
+        return make_label(piece, color, number)
+
+    def valid_moves(self) -> List[Move]:
+        """Every move available to the player whose turn it is"""
+        if self._valid_moves[-1] is None:
+            self._valid_moves[-1] = self._generate_valid_moves()
+        return self._valid_moves[-1]
+
+    def _generate_valid_moves(self) -> List[Move]:
+        if self.is_over:
+            return []
+        color = self.turn_color
+        moves = []
+        locations = placement_locations(self.hive.stacks, color)
+        for piece in self.pieces_in_hand(color):
+            label = self.next_label(piece, color)
+            for location in locations:
+                moves.append(Move(label, location))
+        if self.queen(color) is not None:
+            for label, hex in self.hexes.items():
+                if hex.color != color or not hex.is_on_top:
+                    continue
+                for location in hex.moveable_locations:
+                    moves.append(Move(label, location))
+        if not moves:
+            moves.append(PASS)
+        return moves
+
+    def play(self, move: Move, check: bool = True):
+        """Play a move, which is first checked against the valid moves.
+
+        Only skip the check when replaying moves that are known to be valid.
+        """
+        if check and move not in self.valid_moves():
+            raise HException(f"Move {move} is not valid in this position.")
+        origin = None
+        if move.is_pass:
+            pass
+        elif move.label in self.hexes:
+            hex = self.hexes[move.label]
+            origin = hex.location
+            self.hive.remove_hex(hex)
+            self.hive.place_hex(hex, move.destination)
+        else:
+            piece, color = parse_label(move.label)
+            hex = self.hive.create_hex(piece, color, move.destination)
+            self.hexes[move.label] = hex
+            self.labels[hex] = move.label
+            self.hands[color][piece] -= 1
+        self.history.append((move, origin))
+        self._valid_moves.append(None)
+
+    def undo(self):
+        try:
+            move, origin = self.history.pop()
+        except IndexError:
+            raise HException("There are no moves to undo.")
+        self._valid_moves.pop()
+        if move.is_pass:
+            return
+        hex = self.hexes[move.label]
+        self.hive.remove_hex(hex)
+        if origin is not None:
+            self.hive.place_hex(hex, origin)
+        else:
+            del self.hexes[move.label]
+            del self.labels[hex]
+            self.hands[hex.color][hex.piece] += 1
+
+    @property
+    def evaluation(self) -> int:
+        """Score of the position for the player whose turn it is"""
+        state = self.state
+        color = self.turn_color
+        if state == GameState.DRAW:
+            return 0
+        if state in (GameState.WHITE_WINS, GameState.BLACK_WINS):
+            won = (state == GameState.WHITE_WINS) == (color == Color.WHITE)
+            return WIN_SCORE if won else -WIN_SCORE
+        opponent = Color.BLACK if color == Color.WHITE else Color.WHITE
+        return self.queen_neighbors(opponent) - self.queen_neighbors(color)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from enum import Enum, auto
+from itertools import count
 from math import sqrt
 from typing import List, NewType, Optional, Set, Tuple, TYPE_CHECKING
 
@@ -9,7 +10,8 @@ if TYPE_CHECKING:
     from .hive import Hive
 
 
-HEX_ID = 0
+# Shared by every hive in the process; next() on a count is atomic in CPython
+HEX_ID = count()
 
 
 class HException(Exception):
@@ -50,6 +52,17 @@ class Direction(Enum):
         }[self]
 
 
+# Change in each coordinate when stepping one hex in a direction
+DIRECTION_OFFSETS = {
+    Direction.RIGHT: (1, -1, 0),
+    Direction.UP_RIGHT: (1, 0, -1),
+    Direction.DOWN_RIGHT: (0, -1, 1),
+    Direction.LEFT: (-1, 1, 0),
+    Direction.UP_LEFT: (0, 1, -1),
+    Direction.DOWN_LEFT: (-1, 0, 1),
+}
+
+
 @dataclass
 class Location:
     x: int
@@ -71,14 +84,8 @@ class Location:
 
     def __add__(self, direction: Direction) -> Location:
         """Return a new location shifted one hex in the target direction"""
-        return {
-            Direction.RIGHT: Location(self.x + 1, self.y - 1, self.z),
-            Direction.UP_RIGHT: Location(self.x + 1, self.y, self.z - 1),
-            Direction.DOWN_RIGHT: Location(self.x, self.y - 1, self.z + 1),
-            Direction.LEFT: Location(self.x - 1, self.y + 1, self.z),
-            Direction.UP_LEFT: Location(self.x, self.y + 1, self.z - 1),
-            Direction.DOWN_LEFT: Location(self.x - 1, self.y, self.z + 1),
-        }[direction]
+        dx, dy, dz = DIRECTION_OFFSETS[direction]
+        return Location(self.x + dx, self.y + dy, self.z + dz)
 
     def __sub__(self, other: Location) -> int:
         """Return the distance between two locations"""
@@ -121,16 +128,14 @@ class Location:
         return cls(rx, ry, rz)
 
 
-@dataclass
+@dataclass(eq=False)
 class Hex:
     hive: Hive
     piece: Piece
     color: Color
 
     def __post_init__(self):
-        global HEX_ID
-        self.id = HEX_ID
-        HEX_ID += 1
+        self.id = next(HEX_ID)
 
     def __hash__(self):
         return self.id
@@ -315,6 +320,9 @@ class Hex:
                     continue
                 if self.can_move_in_direction(direction):
                     break
+            else:
+                # Nowhere left to slide to
+                break
             if self.location + direction == initial_location:
                 break
             self.move_in_direction(direction)
@@ -326,8 +334,7 @@ class Hex:
         self.hive.place_hex(self, initial_location)
         return locations
 
-    @property
-    def moveable_locations(self) -> Set[Location]:
+    def generate_moveable_locations(self) -> Set[Location]:
         return {
             Piece.QUEEN: self.queen_moveable_locations,
             Piece.BEETLE: self.beetle_moveable_locations,
@@ -336,6 +343,18 @@ class Hex:
             Piece.ANT: self.ant_moveable_locations,
         }[self.piece]()
 
+    @property
+    def moveable_locations(self) -> Set[Location]:
+        """Moves for this hex, memoized per position in the hive's move cache"""
+        if not self.is_on_top:
+            return self.generate_moveable_locations()
+        key = (self.hive.zobrist_key, self.location)
+        locations = self.hive.move_cache.get(key)
+        if locations is None:
+            locations = frozenset(self.generate_moveable_locations())
+            self.hive.move_cache.put(key, locations)
+        return set(locations)
+
     def __repr__(self) -> str:
         return (
             f"Hex({self.piece}, {self.color})<id={self.id}, location={self.location}>"
@@ -0,0 +1,328 @@
+"""Game tree of positions for stepping through games and their variations.
+
+Each node stores only the stacks its move changed and shares the rest of the
+position with its ancestors, so adding a move, jumping to any node and comparing
+two variations cost time in proportion to the moves between them rather than the
+size of the board. Valid moves and evaluations are memoized on each node.
+
+Benchmark with ``python -m hive.history --nodes 1000``.
+"""
+
+from __future__ import annotations
+
+from .game import Game, Move, parse_label
+from .hex import HException, Location
+from .hive import Hive, Stacks
+from .stats import deep_sizeof, percentile
+from argparse import ArgumentParser
+from random import Random
+from statistics import median
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# A location whose stack a move changed, with the labels there before and after
+Change = Tuple[Location, Tuple[str, ...], Tuple[str, ...]]
+
+
+class GameNode:
+    __slots__ = (
+        "parent",
+        "move",
+        "ply",
+        "changes",
+        "children",
+        "valid_moves",
+        "evaluation",
+    )
+
+    def __init__(
+        self,
+        parent: Optional[GameNode],
+        move: Optional[Move],
+        changes: Tuple[Change, ...] = (),
+    ):
+        self.parent = parent
+        self.move = move
+        self.ply = 0 if parent is None else parent.ply + 1
+        # Stacks the move changed, as labels bottom first. Everything else is
+        # shared with the parent by not being stored at all.
+        self.changes = changes
+        self.children: Dict[Move, GameNode] = {}
+        # Memoized the first time they are asked for
+        self.valid_moves: Optional[List[Move]] = None
+        self.evaluation: Optional[int] = None
+
+    def child(self, move: Move) -> GameNode:
+        """The node reached by the move, created if this is its first visit"""
+        try:
+            return self.children[move]
+        except KeyError:
+            pass
+        changes: List[Change] = []
+        if not move.is_pass:
+            origin = self.location_of(move.label)
+            if origin is not None:
+                stack = self.stack_at(origin)
+                changes.append((origin, stack, stack[:-1]))
+            stack = self.stack_at(move.destination)
+            changes.append((move.destination, stack, stack + (move.label,)))
+        node = GameNode(self, move, tuple(changes))
+        self.children[move] = node
+        return node
+
+    def location_of(self, label: str) -> Optional[Location]:
+        """Where the piece is, found from the last move that played it"""
+        node: Optional[GameNode] = self
+        while node is not None and node.move is not None:
+            if node.move.label == label:
+                return node.move.destination
+            node = node.parent
+        return None
+
+    def stack_at(self, location: Location) -> Tuple[str, ...]:
+        """Labels at the location, found from the last move that changed it"""
+        node: Optional[GameNode] = self
+        while node is not None:
+            for changed, _, after in node.changes:
+                if changed == location:
+                    return after
+            node = node.parent
+        return ()
+
+    @property
+    def line(self) -> List[GameNode]:
+        """Nodes from the root of the tree to this one"""
+        nodes = []
+        node: Optional[GameNode] = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        return nodes[::-1]
+
+    @property
+    def moves(self) -> List[Move]:
+        return [node.move for node in self.line[1:]]
+
+    def ancestor(self, ply: int) -> GameNode:
+        if not 0 <= ply <= self.ply:
+            raise HException(f"There is no ply {ply} before this position.")
+        node = self
+        while node.ply > ply:
+            node = node.parent
+        return node
+
+    def to_labels(self) -> Dict[Location, Tuple[str, ...]]:
+        """Labels at every occupied location, replayed from the root"""
+        labels: Dict[Location, Tuple[str, ...]] = {}
+        for node in self.line:
+            for location, _, after in node.changes:
+                labels[location] = after
+        return {location: stack for location, stack in labels.items() if stack}
+
+    def to_stacks(self) -> Stacks:
+        return {
+            location: [parse_label(label) for label in labels]
+            for location, labels in self.to_labels().items()
+        }
+
+    def __repr__(self) -> str:
+        return f"GameNode<ply={self.ply}, move={self.move}>"
+
+
+def common_ancestor(a: GameNode, b: GameNode) -> GameNode:
+    while a.ply > b.ply:
+        a = a.parent
+    while b.ply > a.ply:
+        b = b.parent
+    while a is not b:
+        a, b = a.parent, b.parent
+    return a
+
+
+class GameTree:
+    def __init__(self):
+        self.root = GameNode(None, None)
+        self.cursor = self.root
+        # A live game kept in step with whichever node last needed one
+        self._game = Game()
+        self._game_node = self.root
+
+    def game_at(self, node: GameNode) -> Game:
+        """The live game moved to the node through their common ancestor.
+
+        The returned game is shared and is only valid until the next call.
+        """
+        ancestor = common_ancestor(self._game_node, node)
+        while self._game_node is not ancestor:
+            self._game.undo()
+            self._game_node = self._game_node.parent
+        for next_node in node.line[ancestor.ply + 1 :]:
+            self._game.play(next_node.move, check=False)
+        self._game_node = node
+        return self._game
+
+    def valid_moves(self, node: Optional[GameNode] = None) -> List[Move]:
+        node = self.cursor if node is None else node
+        if node.valid_moves is None:
+            node.valid_moves = list(self.game_at(node).valid_moves())
+        return node.valid_moves
+
+    def evaluation(self, node: Optional[GameNode] = None) -> int:
+        node = self.cursor if node is None else node
+        if node.evaluation is None:
+            node.evaluation = self.game_at(node).evaluation
+        return node.evaluation
+
+    def play(self, move: Move, node: Optional[GameNode] = None) -> GameNode:
+        """Play a move from the node, or the cursor, and move the cursor there.
+
+        Playing from anywhere other than the end of a line starts a variation.
+        """
+        node = self.cursor if node is None else node
+        if move not in node.children and move not in self.valid_moves(node):
+            raise HException(f"Move {move} is not valid in this position.")
+        self.cursor = node.child(move)
+        return self.cursor
+
+    def jump(self, node: GameNode):
+        self.cursor = node
+
+    def jump_to_ply(self, ply: int):
+        """Move along the current line, following the first variation forwards"""
+        node = self.cursor.ancestor(min(ply, self.cursor.ply))
+        while node.ply < ply and node.children:
+            node = next(iter(node.children.values()))
+        self.cursor = node
+
+    def back(self):
+        if self.cursor.parent is not None:
+            self.cursor = self.cursor.parent
+
+    def forward(self):
+        self.jump_to_ply(self.cursor.ply + 1)
+
+    @staticmethod
+    def diff(
+        a: GameNode, b: GameNode
+    ) -> Dict[Location, Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+        """Locations whose stacks differ between two nodes, with both stacks.
+
+        Only the moves between each node and their common ancestor are looked at.
+        """
+        ancestor = common_ancestor(a, b)
+        # Stacks at each end, from the change nearest to it, and at the ancestor,
+        # from the change nearest to that
+        ends: Tuple[Dict[Location, Tuple[str, ...]], ...] = ({}, {})
+        shared: Dict[Location, Tuple[str, ...]] = {}
+        for node, stacks in zip((a, b), ends):
+            while node is not ancestor:
+                for location, before, after in node.changes:
+                    stacks.setdefault(location, after)
+                    shared[location] = before
+                node = node.parent
+        old, new = ends
+        diff = {}
+        for location, stack in shared.items():
+            old_stack = old.get(location, stack)
+            new_stack = new.get(location, stack)
+            if old_stack != new_stack:
+                diff[location] = (old_stack, new_stack)
+        return diff
+
+    def __iter__(self) -> Iterator[GameNode]:
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            yield node
+            nodes.extend(node.children.values())
+
+
+def build_random_tree(num_nodes: int, random: Random) -> GameTree:
+    """Grow a tree by playing random moves from randomly chosen nodes"""
+    tree = GameTree()
+    nodes = [tree.root]
+    while len(nodes) < num_nodes:
+        node = random.choice(nodes)
+        moves = tree.valid_moves(node)
+        if not moves:
+            continue
+        num_children = len(node.children)
+        child = tree.play(random.choice(moves), node)
+        if len(node.children) > num_children:
+            nodes.append(child)
+    return tree
+
+
+def dict_diff(
+    old: Dict[Location, Tuple[str, ...]], new: Dict[Location, Tuple[str, ...]]
+) -> Dict[Location, Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+    """Diff of two whole positions, which the tree's diff is compared against"""
+    return {
+        location: (old.get(location, ()), new.get(location, ()))
+        for location in old.keys() | new.keys()
+        if old.get(location) != new.get(location)
+    }
+
+
+def benchmark(num_nodes: int, jumps: int, seed: Optional[int] = None):
+    random = Random(seed)
+    start = perf_counter()
+    tree = build_random_tree(num_nodes, random)
+    elapsed = perf_counter() - start
+    nodes = list(tree)
+    print(f"Built {len(nodes)} nodes in {elapsed:.2f}s")
+
+    # The simple alternative keeps a whole copy of the position on every node
+    copies = {node: node.to_labels() for node in nodes}
+    shared = deep_sizeof([node.changes for node in nodes])
+    flat = deep_sizeof(list(copies.values()))
+    print(
+        f"Positions: {shared / 1024:.1f} KiB as changes"
+        f" vs {flat / 1024:.1f} KiB as separate copies"
+        f" ({1000 * shared / len(nodes) / 1024:.1f} KiB per 1,000 nodes)"
+    )
+    print(f"Whole tree with memoized moves: {deep_sizeof(tree.root) / 1024:.1f} KiB")
+
+    timings: Dict[str, List[float]] = {
+        "jump": [],
+        "diff": [],
+        "diff of copies": [],
+        "jump + game": [],
+        "rebuild hive": [],
+    }
+    for _ in range(jumps):
+        a, b = random.choice(nodes), random.choice(nodes)
+        start = perf_counter()
+        tree.jump(b)
+        timings["jump"].append(perf_counter() - start)
+        start = perf_counter()
+        tree.diff(a, b)
+        timings["diff"].append(perf_counter() - start)
+        start = perf_counter()
+        dict_diff(copies[a], copies[b])
+        timings["diff of copies"].append(perf_counter() - start)
+        start = perf_counter()
+        tree.game_at(b)
+        timings["jump + game"].append(perf_counter() - start)
+        start = perf_counter()
+        Hive.from_stacks(b.to_stacks())
+        timings["rebuild hive"].append(perf_counter() - start)
+    for name, samples in timings.items():
+        print(
+            f"{name}: median={1e6 * median(samples):.1f}us"
+            f" p99={1e6 * percentile(samples, 0.99):.1f}us"
+        )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--jumps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark(args.nodes, args.jumps, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
+from __future__ import annotations
+
 from .hex import (
+    DIRECTION_OFFSETS,
     Color,
     Piece,
     Location,
@@ -6,19 +9,108 @@ from .hex import (
     HException,
     Hex,
 )
-from .draw import Draw
-from collections import defaultdict
-from typing import Dict, Set, List
+from collections import OrderedDict, defaultdict
+from random import Random
+from typing import Any, Dict, FrozenSet, Set, List, Optional, Tuple
 from threading import Thread
 
 
+# Pieces stacked at each location, from the bottom of the stack to the top
+Stacks = Dict[Location, List[Tuple[Piece, Color]]]
+
+MOVE_CACHE_SIZE = 1024
+
+# Random bits for each piece at each location and height, filled in on first use
+ZOBRIST_KEYS: Dict[Tuple[Location, int, Piece, Color], int] = {}
+_zobrist_random = Random(0)
+
+
+def zobrist_key(location: Location, height: int, piece: Piece, color: Color) -> int:
+    key = (location, height, piece, color)
+    try:
+        return ZOBRIST_KEYS[key]
+    except KeyError:
+        return ZOBRIST_KEYS.setdefault(key, _zobrist_random.getrandbits(64))
+
+
+class MoveCache:
+    """Least recently used cache of the moves for the top hex at a location.
+
+    Entries are keyed by the Zobrist key of the whole position, so any change to
+    the board makes the old entries unreachable and they age out.
+    """
+
+    def __init__(self, maxsize: int = MOVE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[Tuple[int, Location], FrozenSet[Location]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[int, Location]) -> Optional[FrozenSet[Location]]:
+        try:
+            locations = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return locations
+
+    def put(self, key: Tuple[int, Location], locations: FrozenSet[Location]):
+        self.entries[key] = locations
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+
 class Hive:
-    def __init__(self):
+    def __init__(self, draw: bool = True, move_cache: Optional[MoveCache] = None):
         self.location_to_hex: Dict[Location, list[Hex]] = defaultdict(list)
         self.hex_to_location: Dict[Hex, Location] = {}
-        self.drawer: Draw = Draw(self)
-        self.draw_thread = Thread(target=self.drawer.draw_hive, daemon=True)
-        self.draw_thread.start()
+        # Updated on every placement and removal, identifying the position
+        self.zobrist_key = 0
+        self.move_cache = move_cache if move_cache is not None else MoveCache()
+        # A draw.Draw, imported only when drawing so that headless hives do not
+        # require pygame
+        self.drawer: Optional[Any] = None
+        self.draw_thread: Optional[Thread] = None
+        if draw:
+            from . import draw as drawing
+
+            self.drawer = drawing.Draw(self)
+            self.draw_thread = Thread(target=self.drawer.draw_hive, daemon=True)
+            self.draw_thread.start()
+
+    @classmethod
+    def from_stacks(
+        cls, stacks: Stacks, draw: bool = False, move_cache: Optional[MoveCache] = None
+    ) -> Hive:
+        """Build a new hive holding the given stacks of pieces"""
+        hive = cls(draw=draw, move_cache=move_cache)
+        for location, stack in stacks.items():
+            for piece, color in stack:
+                hive.create_hex(piece, color, location)
+        return hive
+
+    @property
+    def stacks(self) -> Stacks:
+        """Return a snapshot of the pieces at every occupied location"""
+        return {
+            location: [(hex.piece, hex.color) for hex in hexes]
+            for location, hexes in self.location_to_hex.items()
+            if hexes
+        }
 
     def create_hex(self, piece: Piece, color: Color, location: Location = None) -> Hex:
         hex = Hex(self, piece, color)
@@ -29,9 +121,11 @@ class Hive:
     def place_hex(self, hex: Hex, location: Location):
         if hex in self.hex_to_location:
             raise HException(f"Hex {hex} is already on the grid.")
-        if self.location_to_hex[location] and hex.piece != Piece.BEETLE:
+        if location in self.location_to_hex and hex.piece != Piece.BEETLE:
             raise HException(f"There is already a hex at location {location}.")
-        self.location_to_hex[location].append(hex)
+        hexes = self.location_to_hex[location]
+        self.zobrist_key ^= zobrist_key(location, len(hexes), hex.piece, hex.color)
+        hexes.append(hex)
         self.hex_to_location[hex] = location
 
     def move_hex(self, hex: Hex, direction: Direction):
@@ -44,7 +138,8 @@ class Hive:
         self.place_hex(hex, old_location + direction)
 
     def get_all_hexes_at_location(self, location: Location) -> List[Hex]:
-        return self.location_to_hex[location]
+        # Avoid indexing the defaultdict so empty locations are never added
+        return self.location_to_hex.get(location, [])
 
     def get_top_hex_by_location(self, location: Location) -> Hex:
         try:
@@ -61,8 +156,12 @@ class Hive:
     def remove_hex(self, hex: Hex):
         location = self.get_location_of_hex(hex)
         del self.hex_to_location[hex]
-        if hex == self.location_to_hex[location][-1]:
-            self.location_to_hex[location].pop()
+        hexes = self.location_to_hex[location]
+        if hex == hexes[-1]:
+            hexes.pop()
+            self.zobrist_key ^= zobrist_key(location, len(hexes), hex.piece, hex.color)
+            if not hexes:
+                del self.location_to_hex[location]
         else:
             raise HException(
                 f"Hex {hex} is beneath hex {self.location_to_hex[location][-1]} and cannot be removed."
@@ -111,7 +210,26 @@ class Hive:
 
     @property
     def is_connected(self) -> bool:
-        return self.all_top_level_hexes == self.connected_hexes
+        """Whether all_top_level_hexes == connected_hexes, searched by location.
+
+        As with connected_hexes, a lone hex does not count as connected.
+        Coordinates are searched as plain tuples since this runs for every step
+        a hex slides during move generation.
+        """
+        occupied = {
+            (location.x, location.y, location.z) for location in self.location_to_hex
+        }
+        start = list(occupied)[0]
+        visited = {start}
+        frontier = [start]
+        while frontier:
+            x, y, z = frontier.pop()
+            for dx, dy, dz in DIRECTION_OFFSETS.values():
+                neighbor = (x + dx, y + dy, z + dz)
+                if neighbor in occupied and neighbor not in visited:
+                    visited.add(neighbor)
+                    frontier.append(neighbor)
+        return len(occupied) > 1 and len(visited) == len(occupied)
 
     # @property
     # def offset_grid_graph(self) -> Dict[Hex, Tuple[int, int]]:
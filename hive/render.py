@@ -0,0 +1,251 @@
+"""Headless rendering of positions to PNG thumbnails.
+
+Positions are drawn with the same ``Draw`` code as the interactive board, onto
+offscreen surfaces sized to fit the hive. Batches are spread across a process
+pool, with each worker keeping its own sprite cache.
+
+Render UHP game strings, one per line, with
+``python -m hive.render games.txt --out thumbnails/`` or benchmark with
+``python -m hive.render --random 1000``.
+"""
+
+from __future__ import annotations
+
+from .draw import FONT, WHITE, Draw
+from .game import STARTING_HAND, Game, placement_locations
+from .hex import Color, HException, Location
+from .hive import Hive, Stacks
+from .uhp import parse_move, play_move_string
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
+from math import sqrt
+from random import Random
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import os
+import pygame
+import sys
+from pygame import freetype
+
+
+# Distance from the center of a hex to its furthest edge, in units of radius
+HALF_WIDTH = sqrt(3) / 2
+HALF_HEIGHT = 1
+
+MAX_RADIUS = 100
+
+# A position, given as stacks or as a UHP game string, and the path to save it to
+Job = Tuple[Union[Stacks, str], str]
+
+
+@lru_cache(maxsize=None)
+def load_font() -> freetype.Font:
+    freetype.init()
+    return freetype.Font(FONT, 10)
+
+
+def fit(
+    locations: Iterable[Location], width: int, height: int, margin: int
+) -> Tuple[Tuple[float, float], float]:
+    """Center and radius which fit every location inside the image"""
+    pixels = [location.to_pixel for location in locations]
+    if not pixels:
+        return (width / 2, height / 2), MAX_RADIUS
+    min_x = min(x for x, _ in pixels) - HALF_WIDTH
+    max_x = max(x for x, _ in pixels) + HALF_WIDTH
+    min_y = min(y for _, y in pixels) - HALF_HEIGHT
+    max_y = max(y for _, y in pixels) + HALF_HEIGHT
+    radius = min(
+        (width - 2 * margin) / (max_x - min_x),
+        (height - 2 * margin) / (max_y - min_y),
+        MAX_RADIUS,
+    )
+    center = (
+        width / 2 - radius * (min_x + max_x) / 2,
+        height / 2 - radius * (min_y + max_y) / 2,
+    )
+    return center, radius
+
+
+def render(stacks: Stacks, width: int, height: int, margin: int = 4) -> pygame.Surface:
+    drawer = Draw(Hive.from_stacks(stacks))
+    drawer.screen = pygame.Surface((width, height))
+    drawer.center, drawer.radius = fit(stacks, width, height, margin)
+    drawer.font = load_font()
+    drawer.font.size = 0.15 * drawer.radius
+    drawer.screen.fill(WHITE)
+    drawer.draw_board(drawer.viewport)
+    return drawer.screen
+
+
+def stacks_from_game_string(game_string: str, validate: bool = False) -> Stacks:
+    """Position reached by the moves of a UHP game string.
+
+    Moves are trusted to be legal unless validated, which generates every valid
+    move at every ply and costs far more than drawing the position.
+    """
+    game, move_strings = Game(), []
+    for move_string in game_string.strip().split(";")[3:]:
+        if validate:
+            play_move_string(game, move_strings, move_string)
+        else:
+            game.play(parse_move(game, move_string), check=False)
+    return game.hive.stacks
+
+
+def parse_game_string(
+    game_string: str, validate: bool = False
+) -> Tuple[Optional[Stacks], Optional[str]]:
+    """Position for a game string, or the reason it could not be played out"""
+    try:
+        return stacks_from_game_string(game_string, validate), None
+    except HException as e:
+        return None, str(e)
+
+
+def random_position(random: Random, num_pieces: int) -> Stacks:
+    """Position reached by placing pieces at random, alternating colors"""
+    stacks: Stacks = {}
+    hands = {
+        color: [piece for piece, count in STARTING_HAND.items() for _ in range(count)]
+        for color in Color
+    }
+    for idx in range(num_pieces):
+        color = Color.WHITE if idx % 2 == 0 else Color.BLACK
+        locations = sorted(placement_locations(stacks, color), key=str)
+        if not locations or not hands[color]:
+            break
+        piece = hands[color].pop(random.randrange(len(hands[color])))
+        stacks[random.choice(locations)] = [(piece, color)]
+    return stacks
+
+
+def _render_job(args: Tuple[Job, int, int, bool]) -> Optional[str]:
+    """Render a job to its path, returning why it was skipped if it was"""
+    (position, path), width, height, validate = args
+    if isinstance(position, str):
+        stacks, error = parse_game_string(position, validate)
+        if stacks is None:
+            return error
+    else:
+        stacks = position
+    pygame.image.save(render(stacks, width, height), path)
+    return None
+
+
+@dataclass
+class RenderReport:
+    num_images: int = 0
+    # Paths of the jobs that could not be rendered, with the reason why
+    skipped: List[Tuple[str, str]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def images_per_second(self) -> float:
+        return self.num_images / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Rendered {self.num_images} images in {self.elapsed:.2f}s"
+            f" ({self.images_per_second:.1f} images/s),"
+            f" skipped {len(self.skipped)}"
+        )
+
+
+def render_batch(
+    jobs: Iterable[Job],
+    width: int = 256,
+    height: int = 256,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    validate: bool = False,
+) -> RenderReport:
+    """Render positions to the paths given with them across a process pool.
+
+    Jobs are read a batch at a time, so any number of them can be streamed
+    through without holding them all in memory.
+    """
+    report = RenderReport()
+    start = perf_counter()
+    batch_size = 4 * chunksize * (workers or os.cpu_count() or 1)
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(workers) as executor:
+        while True:
+            batch = list(islice(jobs, batch_size))
+            if not batch:
+                break
+            errors = executor.map(
+                _render_job,
+                ((job, width, height, validate) for job in batch),
+                chunksize=chunksize,
+            )
+            for (_, path), error in zip(batch, errors):
+                if error is None:
+                    report.num_images += 1
+                else:
+                    report.skipped.append((path, error))
+    report.elapsed = perf_counter() - start
+    return report
+
+
+def random_jobs(
+    num_positions: int, num_pieces: int, seed: int, out: str
+) -> Iterator[Job]:
+    random = Random(seed)
+    for idx in range(num_positions):
+        path = os.path.join(out, f"{idx:06d}.png")
+        yield random_position(random, num_pieces), path
+
+
+def game_jobs(path: str, out: str) -> Iterator[Job]:
+    """A job for every game string in a file.
+
+    Images are numbered by line, so lines that are skipped leave gaps.
+    """
+    with open(path) as f:
+        for idx, line in enumerate(f, 1):
+            if line.strip():
+                yield line, os.path.join(out, f"{idx:06d}.png")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "games", nargs="?", help="file of UHP game strings, one per line"
+    )
+    parser.add_argument("--random", type=int, help="render random positions instead")
+    parser.add_argument("--pieces", type=int, default=16)
+    parser.add_argument("--out", default="thumbnails")
+    parser.add_argument("--width", type=int, default=256)
+    parser.add_argument("--height", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="check every move of a game string is legal, which is much slower",
+    )
+    args = parser.parse_args()
+
+    if args.random is not None:
+        jobs = random_jobs(args.random, args.pieces, args.seed, args.out)
+    elif args.games is not None:
+        jobs = game_jobs(args.games, args.out)
+    else:
+        parser.error("either a games file or --random is required")
+
+    os.makedirs(args.out, exist_ok=True)
+    report = render_batch(
+        jobs, args.width, args.height, args.workers, validate=args.validate
+    )
+    for path, error in report.skipped:
+        print(f"Skipping {path}: {error}", file=sys.stderr)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
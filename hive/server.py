@@ -0,0 +1,476 @@
+"""Asyncio server hosting many concurrent Hive games in one process.
+
+Clients speak JSON lines over TCP. Every request is an object with an ``op``
+field and an optional ``id`` which is echoed back in the response:
+
+    {"op": "new"}                                          -> {"game": 0}
+    {"op": "place", "game": 0, "piece": "ANT", "color": "WHITE", "location": [0, 0, 0]}
+    {"op": "moves", "game": 0, "location": [0, 0, 0]}      -> {"locations": [...]}
+    {"op": "move", "game": 0, "from": [0, 0, 0], "to": [1, -1, 0]}
+    {"op": "pass", "game": 0}
+    {"op": "state", "game": 0}                             -> {"stacks": [...]}
+    {"op": "close", "game": 0}
+    {"op": "stats"}
+
+Responses carry ``"ok": true`` or ``"ok": false`` with an ``error`` message.
+Games follow the rules in ``hive.game``: players alternate starting with white,
+place pieces from their hand next to their own color, place the queen by their
+fourth piece and only move once it is down. A player with nothing to play
+passes and nothing is accepted once a queen is surrounded. ``state`` reports
+whose turn it is and whether the game is over.
+Move generation runs in a worker pool on a snapshot of the position so the
+event loop never waits on it.
+
+Run with ``python -m hive.server`` or benchmark with ``python -m hive.server --load``.
+"""
+
+from __future__ import annotations
+
+from .game import PASS, Game, GameState, Move, placement_locations
+from .hex import Color, HException, Location, Piece
+from .hive import Hive, MoveCache, Stacks
+from .stats import deep_sizeof, percentile
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import count
+from multiprocessing import get_context
+from random import Random
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import asyncio
+import json
+
+
+Request = Dict[str, Any]
+Response = Dict[str, Any]
+
+LATENCY_SAMPLES = 10000
+
+# Shared by every position a worker process generates moves for
+WORKER_MOVE_CACHE = MoveCache()
+
+
+def parse_location(value: Any) -> Location:
+    try:
+        x, y, z = (int(coordinate) for coordinate in value)
+    except (TypeError, ValueError, OverflowError):
+        raise HException(f"Invalid location {value!r}.")
+    return Location(x, y, z)
+
+
+def dump_location(location: Location) -> List[int]:
+    return [location.x, location.y, location.z]
+
+
+def moveable_locations(
+    stacks: Stacks, location: Location
+) -> Tuple[Set[Location], int, int]:
+    """Moves for the top hex at the location, run inside a worker.
+
+    Returned along with the hits and misses in the worker's move cache while
+    generating them.
+    """
+    hits, misses = WORKER_MOVE_CACHE.hits, WORKER_MOVE_CACHE.misses
+    hive = Hive.from_stacks(stacks, move_cache=WORKER_MOVE_CACHE)
+    locations = hive.get_top_hex_by_location(location).moveable_locations
+    return (
+        locations,
+        WORKER_MOVE_CACHE.hits - hits,
+        WORKER_MOVE_CACHE.misses - misses,
+    )
+
+
+def valid_moves(history: List[Move]) -> Tuple[List[Move], int, int]:
+    """Every move for the player to move after the history, run inside a worker.
+
+    Returned along with the hits and misses in the worker's move cache.
+    """
+    hits, misses = WORKER_MOVE_CACHE.hits, WORKER_MOVE_CACHE.misses
+    game = Game(move_cache=WORKER_MOVE_CACHE)
+    for move in history:
+        game.play(move, check=False)
+    moves = game.valid_moves()
+    return moves, WORKER_MOVE_CACHE.hits - hits, WORKER_MOVE_CACHE.misses - misses
+
+
+def worker_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Process pool for move generation.
+
+    Workers are spawned rather than forked so they do not inherit client sockets,
+    which would keep connections open after the server closes them.
+    """
+    return ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+
+
+@dataclass
+class HostedGame:
+    id: int
+    game: Game = field(default_factory=Game)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Memory held by the game, measured after each change so that stats need
+    # not walk every game
+    size: int = 0
+
+    @property
+    def hive(self) -> Hive:
+        return self.game.hive
+
+    def measure(self):
+        self.size = deep_sizeof(self.game)
+
+    def check_turn(self, color: Color):
+        if self.game.is_over:
+            raise HException("The game is over.")
+        if color != self.game.turn_color:
+            raise HException(f"It is {self.game.turn_color.name}'s turn.")
+
+
+class HiveServer:
+    def __init__(self, executor: Optional[Executor] = None):
+        self.games: Dict[int, HostedGame] = {}
+        self.game_ids = count()
+        self.executor = executor if executor is not None else worker_pool()
+        self.validation_latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.num_requests = 0
+        # Summed across the move caches of every worker
+        self.move_cache_hits = 0
+        self.move_cache_misses = 0
+        self.connections: Set[asyncio.Task] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.Server:
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Requests must be JSON objects.")
+                except ValueError as e:
+                    response = {"ok": False, "error": f"Malformed request: {e}"}
+                else:
+                    response = await self.handle_request(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self.connections.discard(task)
+
+    async def wait_for_connections(self):
+        """Wait until every client has disconnected"""
+        await asyncio.gather(*self.connections)
+
+    async def handle_request(self, request: Request) -> Response:
+        self.num_requests += 1
+        handlers = {
+            "new": self.op_new,
+            "place": self.op_place,
+            "moves": self.op_moves,
+            "move": self.op_move,
+            "pass": self.op_pass,
+            "state": self.op_state,
+            "close": self.op_close,
+            "stats": self.op_stats,
+        }
+        try:
+            try:
+                handler = handlers[request.get("op")]
+            except KeyError:
+                raise HException(f"Unknown operation {request.get('op')!r}.")
+            response = await handler(request)
+            response["ok"] = True
+        except HException as e:
+            response = {"ok": False, "error": str(e)}
+        except Exception as e:
+            # Includes errors raised by move generation in the worker pool
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        if "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    def get_game(self, request: Request) -> HostedGame:
+        try:
+            return self.games[request["game"]]
+        except (KeyError, TypeError):
+            raise HException(f"No game with id {request.get('game')!r}.")
+
+    async def run_in_worker(self, function: Callable, *args) -> Any:
+        """Run move generation in the pool, counting its move cache lookups"""
+        loop = asyncio.get_running_loop()
+        result, hits, misses = await loop.run_in_executor(
+            self.executor, function, *args
+        )
+        self.move_cache_hits += hits
+        self.move_cache_misses += misses
+        return result
+
+    async def generate_moves(
+        self, game: HostedGame, location: Location
+    ) -> Set[Location]:
+        hive = game.hive
+        if not hive.location_is_occupied(location):
+            raise HException(f"No hex was found at location {location}.")
+        return await self.run_in_worker(moveable_locations, hive.stacks, location)
+
+    async def op_new(self, request: Request) -> Response:
+        game = HostedGame(next(self.game_ids))
+        game.measure()
+        self.games[game.id] = game
+        return {"game": game.id}
+
+    async def op_place(self, request: Request) -> Response:
+        game = self.get_game(request)
+        try:
+            piece = Piece[request["piece"]]
+            color = Color[request["color"]]
+        except KeyError:
+            raise HException("A valid piece and color are required.")
+        location = parse_location(request.get("location"))
+        async with game.lock:
+            game.check_turn(color)
+            rules = game.game
+            if piece not in rules.pieces_in_hand(color):
+                raise HException(f"{color.name} cannot place {piece.name} now.")
+            if location not in placement_locations(rules.hive.stacks, color):
+                raise HException(f"{color.name} cannot place a piece at {location}.")
+            rules.play(Move(rules.next_label(piece, color), location), check=False)
+            game.measure()
+        return {}
+
+    async def op_moves(self, request: Request) -> Response:
+        game = self.get_game(request)
+        location = parse_location(request.get("location"))
+        async with game.lock:
+            locations = await self.generate_moves(game, location)
+        return {"locations": [dump_location(location) for location in locations]}
+
+    async def op_move(self, request: Request) -> Response:
+        game = self.get_game(request)
+        old_location = parse_location(request.get("from"))
+        new_location = parse_location(request.get("to"))
+        async with game.lock:
+            rules = game.game
+            if not game.hive.location_is_occupied(old_location):
+                raise HException(f"No hex was found at location {old_location}.")
+            hex = game.hive.get_top_hex_by_location(old_location)
+            game.check_turn(hex.color)
+            if rules.queen(hex.color) is None:
+                raise HException(
+                    f"{hex.color.name} must place their queen before moving."
+                )
+            start = perf_counter()
+            locations = await self.generate_moves(game, old_location)
+            self.validation_latencies.append(perf_counter() - start)
+            if new_location not in locations:
+                raise HException(
+                    f"The hex at {old_location} cannot move to {new_location}."
+                )
+            rules.play(Move(rules.labels[hex], new_location), check=False)
+            game.measure()
+        return {}
+
+    async def op_pass(self, request: Request) -> Response:
+        game = self.get_game(request)
+        async with game.lock:
+            rules = game.game
+            game.check_turn(rules.turn_color)
+            history = [move for move, _ in rules.history]
+            if await self.run_in_worker(valid_moves, history) != [PASS]:
+                raise HException(f"{rules.turn_color.name} has moves to play.")
+            rules.play(PASS, check=False)
+            game.measure()
+        return {}
+
+    async def op_state(self, request: Request) -> Response:
+        game = self.get_game(request)
+        return {
+            "stacks": [
+                [dump_location(location), [[p.name, c.name] for p, c in stack]]
+                for location, stack in game.hive.stacks.items()
+            ],
+            "num_moves": game.game.ply,
+            "turn": game.game.turn_color.name,
+            "state": game.game.state.name,
+        }
+
+    async def op_close(self, request: Request) -> Response:
+        game = self.get_game(request)
+        del self.games[game.id]
+        return {}
+
+    async def op_stats(self, request: Request) -> Response:
+        return self.stats
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        latencies = list(self.validation_latencies)
+        sizes = [game.size for game in self.games.values()]
+        lookups = self.move_cache_hits + self.move_cache_misses
+        return {
+            "games": len(self.games),
+            "requests": self.num_requests,
+            "validations": len(latencies),
+            "p50_validation_ms": 1000 * percentile(latencies, 0.5),
+            "p99_validation_ms": 1000 * percentile(latencies, 0.99),
+            "mean_game_bytes": sum(sizes) / len(sizes) if sizes else 0,
+            "max_game_bytes": max(sizes, default=0),
+            "move_cache_hit_rate": self.move_cache_hits / lookups if lookups else 0.0,
+        }
+
+
+class Client:
+    """Minimal client used by the load generator"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.request_ids = count()
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> Client:
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, op: str, **kwargs) -> Response:
+        request = {"op": op, "id": next(self.request_ids), **kwargs}
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+# A legal opening which leaves every piece type free to move
+OPENING: List[Tuple[Piece, Color, Tuple[int, int, int]]] = [
+    (Piece.ANT, Color.WHITE, (0, 0, 0)),
+    (Piece.SPIDER, Color.BLACK, (1, -1, 0)),
+    (Piece.QUEEN, Color.WHITE, (-1, 1, 0)),
+    (Piece.QUEEN, Color.BLACK, (2, -2, 0)),
+    (Piece.BEETLE, Color.WHITE, (-1, 0, 1)),
+    (Piece.GRASSHOPPER, Color.BLACK, (2, -1, -1)),
+]
+
+
+async def play_random_game(
+    client: Client, moves: int, random: Random, round_trips: List[float]
+) -> int:
+    """Set up the opening and play random moves, returning the moves made"""
+    game = (await client.request("new"))["game"]
+    for piece, color, location in OPENING:
+        await client.request(
+            "place", game=game, piece=piece.name, color=color.name, location=location
+        )
+    made = 0
+    for _ in range(moves):
+        state = await client.request("state", game=game)
+        if state["state"] != GameState.IN_PROGRESS.name:
+            break
+        origins = [
+            location
+            for location, stack in state["stacks"]
+            if stack[-1][1] == state["turn"]
+        ]
+        if not origins:
+            await client.request("pass", game=game)
+            continue
+        origin = random.choice(origins)
+        options = (await client.request("moves", game=game, location=origin))[
+            "locations"
+        ]
+        if not options:
+            continue
+        start = perf_counter()
+        response = await client.request(
+            "move", game=game, **{"from": origin, "to": random.choice(options)}
+        )
+        round_trips.append(perf_counter() - start)
+        made += response["ok"]
+    return made
+
+
+async def run_load(
+    host: str, port: int, games: int, moves: int, seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """Play many games concurrently against a server and report its latency"""
+    random = Random(seed)
+    round_trips: List[float] = []
+    clients = [await Client.connect(host, port) for _ in range(games)]
+    start = perf_counter()
+    made = await asyncio.gather(
+        *(
+            play_random_game(client, moves, Random(random.random()), round_trips)
+            for client in clients
+        )
+    )
+    elapsed = perf_counter() - start
+    stats = await clients[0].request("stats")
+    for client in clients:
+        await client.close()
+    stats.pop("id", None)
+    stats.pop("ok", None)
+    stats.update(
+        {
+            "elapsed_s": elapsed,
+            "moves_made": sum(made),
+            "moves_per_s": sum(made) / elapsed if elapsed else 0.0,
+            "p99_round_trip_ms": 1000 * percentile(round_trips, 0.99),
+        }
+    )
+    return stats
+
+
+async def serve(host: str, port: int, workers: Optional[int]):
+    server = HiveServer(worker_pool(workers))
+    tcp_server = await server.start(host, port)
+    print(f"Serving on {', '.join(str(s.getsockname()) for s in tcp_server.sockets)}")
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+async def benchmark(games: int, moves: int, workers: Optional[int], seed: int):
+    with worker_pool(workers) as executor:
+        server = HiveServer(executor)
+        tcp_server = await server.start()
+        host, port = tcp_server.sockets[0].getsockname()[:2]
+        async with tcp_server:
+            stats = await run_load(host, port, games, moves, seed)
+            await server.wait_for_connections()
+    for key, value in stats.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--load", action="store_true", help="benchmark against a local load generator"
+    )
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--moves", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.load:
+        asyncio.run(benchmark(args.games, args.moves, args.workers, args.seed))
+    else:
+        asyncio.run(serve(args.host, args.port, args.workers))
+
+
+if __name__ == "__main__":
+    main()
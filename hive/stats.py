@@ -0,0 +1,35 @@
+"""Measurements shared by the benchmarks."""
+
+from __future__ import annotations
+
+from enum import Enum
+from types import ModuleType
+from typing import Any, List
+
+import gc
+import sys
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Approximate the memory held by an object and everything it references.
+
+    Types, modules and enum members are shared between games and not counted.
+    """
+    size = 0
+    seen = set()
+    objects = [obj]
+    while objects:
+        obj = objects.pop()
+        if id(obj) in seen or isinstance(obj, (type, ModuleType, Enum)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        objects.extend(gc.get_referents(obj))
+    return size
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,515 @@
+"""Universal Hive Protocol engine over stdin/stdout.
+
+Supports the base game with the ``info``, ``newgame``, ``play``, ``pass``,
+``validmoves``, ``bestmove``, ``undo`` and ``options`` commands. Searches run
+in the background and any new command interrupts them, so ``bestmove`` always
+answers with the best move found so far. A bare ``bestmove`` searches for
+``DEFAULT_SEARCH_TIME`` seconds. The non-standard ``stats`` command reports how
+often move generation was answered from the current game's move cache.
+
+Run with ``python -m hive.uhp`` or benchmark round trips with ``python -m hive.uhp --bench``.
+"""
+
+from __future__ import annotations
+
+from .game import GameState, Game, Move, ORIGIN, PASS, WIN_SCORE
+from .hex import Direction, HException, Hex, Location
+from .stats import percentile
+from argparse import ArgumentParser
+from random import Random
+from statistics import median
+from subprocess import PIPE, Popen
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, TextIO
+
+import sys
+
+
+ENGINE_NAME = "hive"
+ENGINE_VERSION = "0.1"
+
+GAME_TYPE = "Base"
+
+STATE_NAMES = {
+    GameState.NOT_STARTED: "NotStarted",
+    GameState.IN_PROGRESS: "InProgress",
+    GameState.DRAW: "Draw",
+    GameState.WHITE_WINS: "WhiteWins",
+    GameState.BLACK_WINS: "BlackWins",
+}
+
+# Where a piece ends up relative to the piece it is written against
+DIRECTION_FORMATS = {
+    Direction.RIGHT: "{}-",
+    Direction.LEFT: "-{}",
+    Direction.UP_RIGHT: "{}/",
+    Direction.DOWN_LEFT: "/{}",
+    Direction.UP_LEFT: "\\{}",
+    Direction.DOWN_RIGHT: "{}\\",
+}
+
+MAX_DEPTH = 64
+
+# Seconds a bare ``bestmove`` searches for
+DEFAULT_SEARCH_TIME = 5.0
+
+
+class UHPError(HException):
+    pass
+
+
+class InvalidMove(UHPError):
+    pass
+
+
+class SearchStopped(Exception):
+    pass
+
+
+def format_move(game: Game, move: Move) -> str:
+    """Write a move relative to a piece already on the board"""
+    if move.is_pass:
+        return PASS.label
+    if not game.hexes:
+        return move.label
+    moving = game.hexes.get(move.label)
+
+    def reference(location: Location) -> Optional[Hex]:
+        hexes = game.hive.location_to_hex.get(location, [])
+        hexes = [hex for hex in hexes if hex is not moving]
+        return hexes[-1] if hexes else None
+
+    hex = reference(move.destination)
+    if hex is not None:
+        return f"{move.label} {game.labels[hex]}"
+    for direction in Direction:
+        hex = reference(move.destination + -direction)
+        if hex is not None:
+            return f"{move.label} " + DIRECTION_FORMATS[direction].format(
+                game.labels[hex]
+            )
+    raise UHPError(f"Move {move} is not next to any other piece.")
+
+
+def parse_move(game: Game, move_string: str) -> Move:
+    tokens = move_string.split()
+    if tokens == [PASS.label]:
+        return PASS
+    if len(tokens) == 1:
+        if game.hexes:
+            raise InvalidMove(f"Move {move_string!r} needs a relative position.")
+        return Move(tokens[0], ORIGIN)
+    if len(tokens) != 2:
+        raise InvalidMove(f"Unable to parse move {move_string!r}.")
+    label, position = tokens
+    direction, reference_label = None, position
+    for position_direction, position_format in DIRECTION_FORMATS.items():
+        prefix, suffix = position_format.split("{}")
+        if (prefix and position.startswith(prefix)) or (
+            suffix and position.endswith(suffix)
+        ):
+            direction = position_direction
+            reference_label = position[len(prefix) : len(position) - len(suffix)]
+            break
+    try:
+        location = game.hexes[reference_label].location
+    except KeyError:
+        raise InvalidMove(f"Piece {reference_label!r} is not on the board.")
+    if direction is not None:
+        location = location + direction
+    return Move(label, location)
+
+
+def play_move_string(game: Game, move_strings: List[str], move_string: str):
+    """Validate and play a move, recording how it is written"""
+    move = parse_move(game, move_string)
+    if game.is_over:
+        raise InvalidMove("The game is over.")
+    if move not in game.valid_moves():
+        raise InvalidMove(f"Move {move_string!r} is not valid in this position.")
+    move_strings.append(format_move(game, move))
+    game.play(move)
+
+
+def game_string(game: Game, move_strings: List[str]) -> str:
+    turn = f"{game.turn_color.name.capitalize()}[{game.turn_number}]"
+    return ";".join([GAME_TYPE, STATE_NAMES[game.state], turn] + move_strings)
+
+
+def parse_duration(value: str) -> float:
+    try:
+        hours, minutes, seconds = (int(part) for part in value.split(":"))
+    except ValueError:
+        raise UHPError(f"Invalid time {value!r}, expected hh:mm:ss.")
+    return 3600 * hours + 60 * minutes + seconds
+
+
+def generate_moves(game: Game, check: Callable[[], None]):
+    """Generate the moves of the player to move one hex at a time.
+
+    Moves go into the hive's move cache, where ``Game.valid_moves`` finds them.
+    The check runs before each hex and may raise to stop early without losing
+    the moves generated so far.
+    """
+    color = game.turn_color
+    if game.is_over or game.queen(color) is None:
+        return
+    for hex in list(game.hexes.values()):
+        check()
+        if hex.color == color and hex.is_on_top:
+            hex.moveable_locations
+
+
+class Search:
+    """Iterative deepening negamax, stopped by a deadline, a depth or an event"""
+
+    def __init__(
+        self,
+        game: Game,
+        stop: Event,
+        max_depth: int = MAX_DEPTH,
+        deadline: Optional[float] = None,
+    ):
+        self.game = game
+        self.stop = stop
+        self.max_depth = max_depth
+        self.deadline = deadline
+        self.nodes = 0
+
+    def check(self):
+        if self.stop.is_set() or (
+            self.deadline is not None and perf_counter() >= self.deadline
+        ):
+            raise SearchStopped()
+
+    def negamax(self, depth: int, alpha: int, beta: int) -> int:
+        self.check()
+        self.nodes += 1
+        if depth == 0 or self.game.is_over:
+            return self.game.evaluation
+        generate_moves(self.game, self.check)
+        for move in self.game.valid_moves():
+            self.game.play(move)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha)
+            finally:
+                self.game.undo()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def best_move(self) -> Move:
+        moves = list(self.game.valid_moves())
+        if not moves:
+            raise UHPError("The game is over.")
+        best = moves[0]
+        try:
+            for depth in range(1, self.max_depth + 1):
+                best_score = -WIN_SCORE - 1
+                for move in moves:
+                    self.game.play(move)
+                    try:
+                        score = -self.negamax(depth - 1, -WIN_SCORE - 1, -best_score)
+                    finally:
+                        self.game.undo()
+                    if score > best_score:
+                        best_score, depth_best = score, move
+                best = depth_best
+                # Search the best move first at the next depth
+                moves.remove(best)
+                moves.insert(0, best)
+                if abs(best_score) == WIN_SCORE:
+                    break
+        except SearchStopped:
+            pass
+        return best
+
+
+class Engine:
+    def __init__(self, output: TextIO = sys.stdout):
+        self.output = output
+        self.output_lock = Lock()
+        self.game: Optional[Game] = None
+        self.move_strings: List[str] = []
+        # Held by whichever thread is using the game
+        self.game_lock = Lock()
+        self.stop = Event()
+        self.search_thread: Optional[Thread] = None
+
+    @property
+    def commands(self) -> Dict[str, Callable[[str], Optional[str]]]:
+        return {
+            "info": self.info,
+            "newgame": self.newgame,
+            "play": self.play,
+            "pass": self.pass_,
+            "validmoves": self.validmoves,
+            "bestmove": self.bestmove,
+            "undo": self.undo,
+            "options": self.options,
+            "stats": self.stats,
+        }
+
+    def write(self, *lines: str):
+        with self.output_lock:
+            for line in lines:
+                print(line, file=self.output)
+            print("ok", file=self.output, flush=True)
+
+    def run(self, input: TextIO = sys.stdin):
+        self.execute("info")
+        for line in iter(input.readline, ""):
+            command = line.strip()
+            self.interrupt()
+            if command == "exit":
+                break
+            if command:
+                self.execute(command)
+        self.interrupt()
+
+    def interrupt(self):
+        """Stop any running search, which answers with its best move so far"""
+        if self.search_thread is not None:
+            self.stop.set()
+            self.search_thread.join()
+            self.search_thread = None
+            self.stop.clear()
+
+    def execute(self, command: str):
+        name, _, arguments = command.partition(" ")
+        try:
+            try:
+                handler = self.commands[name]
+            except KeyError:
+                raise UHPError(f"Unknown command {name!r}.")
+            response = handler(arguments.strip())
+        except InvalidMove as e:
+            self.write(f"invalidmove {e}")
+        except HException as e:
+            self.write(f"err {e}")
+        else:
+            if response is not None:
+                self.write(*response.splitlines())
+
+    def require_game(self) -> Game:
+        if self.game is None:
+            raise UHPError("No game in progress, start one with newgame.")
+        return self.game
+
+    def warm_up(self):
+        """Generate moves for the new position in the background.
+
+        Moves are generated one hex at a time into the hive's move cache, so the
+        next command interrupts the warm up between hexes and still reuses the
+        moves generated so far.
+        """
+        game = self.require_game()
+
+        def check():
+            if self.stop.is_set():
+                raise SearchStopped()
+
+        def generate():
+            with self.game_lock:
+                try:
+                    generate_moves(game, check)
+                except SearchStopped:
+                    pass
+
+        self.search_thread = Thread(target=generate, daemon=True)
+        self.search_thread.start()
+
+    @property
+    def game_string(self) -> str:
+        return game_string(self.require_game(), self.move_strings)
+
+    def info(self, arguments: str) -> str:
+        return f"id {ENGINE_NAME} v{ENGINE_VERSION}"
+
+    def options(self, arguments: str) -> str:
+        return ""
+
+    def newgame(self, arguments: str) -> str:
+        fields = arguments.split(";") if arguments else [GAME_TYPE]
+        if fields[0] != GAME_TYPE:
+            raise UHPError(f"Unsupported game type {fields[0]!r}.")
+        if len(fields) == 2:
+            raise UHPError("Game strings need a game state and a turn.")
+        game, move_strings = Game(), []
+        for move_string in fields[3:]:
+            play_move_string(game, move_strings, move_string)
+        if len(fields) > 1:
+            expected = game_string(game, move_strings).split(";")
+            if fields[1:3] != expected[1:3]:
+                raise UHPError(
+                    f"Game string says {';'.join(fields[1:3])} but its moves lead"
+                    f" to {';'.join(expected[1:3])}."
+                )
+        with self.game_lock:
+            self.game, self.move_strings = game, move_strings
+            result = self.game_string
+        self.warm_up()
+        return result
+
+    def play(self, arguments: str) -> str:
+        with self.game_lock:
+            play_move_string(self.require_game(), self.move_strings, arguments)
+            result = self.game_string
+        self.warm_up()
+        return result
+
+    def pass_(self, arguments: str) -> str:
+        return self.play(PASS.label)
+
+    def validmoves(self, arguments: str) -> str:
+        with self.game_lock:
+            game = self.require_game()
+            return ";".join(format_move(game, move) for move in game.valid_moves())
+
+    def bestmove(self, arguments: str) -> None:
+        game = self.require_game()
+        args = arguments.split()
+        max_depth, deadline = MAX_DEPTH, perf_counter() + DEFAULT_SEARCH_TIME
+        if len(args) == 2 and args[0] == "depth":
+            try:
+                max_depth = int(args[1])
+            except ValueError:
+                raise UHPError(f"Invalid depth {args[1]!r}.")
+            deadline = None
+        elif len(args) == 2 and args[0] == "time":
+            deadline = perf_counter() + parse_duration(args[1])
+        elif args:
+            raise UHPError("Usage: bestmove time hh:mm:ss or bestmove depth n.")
+
+        def search():
+            with self.game_lock:
+                try:
+                    move = Search(game, self.stop, max_depth, deadline).best_move()
+                    self.write(format_move(game, move))
+                except HException as e:
+                    self.write(f"err {e}")
+
+        self.search_thread = Thread(target=search, daemon=True)
+        self.search_thread.start()
+
+    def stats(self, arguments: str) -> str:
+        with self.game_lock:
+            cache = self.require_game().hive.move_cache
+            return (
+                f"movecache hits={cache.hits} misses={cache.misses}"
+                f" hitrate={cache.hit_rate:.2f}"
+            )
+
+    def undo(self, arguments: str) -> str:
+        try:
+            count = int(arguments) if arguments else 1
+        except ValueError:
+            raise UHPError(f"Invalid number of moves {arguments!r}.")
+        with self.game_lock:
+            game = self.require_game()
+            if not 0 < count <= game.ply:
+                raise UHPError(f"Unable to undo {count} moves.")
+            for _ in range(count):
+                game.undo()
+                self.move_strings.pop()
+            result = self.game_string
+        self.warm_up()
+        return result
+
+
+class EngineProcess:
+    """Engine running in a subprocess, used to benchmark protocol round trips"""
+
+    def __init__(self):
+        self.process = Popen(
+            [sys.executable, "-m", "hive.uhp"],
+            stdin=PIPE,
+            stdout=PIPE,
+            text=True,
+            bufsize=1,
+        )
+        self.read_response()
+
+    def read_response(self) -> List[str]:
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise UHPError("The engine exited unexpectedly.")
+            line = line.rstrip("\n")
+            if line == "ok":
+                return lines
+            lines.append(line)
+
+    def send(self, command: str):
+        self.process.stdin.write(command + "\n")
+        self.process.stdin.flush()
+
+    def request(self, command: str) -> List[str]:
+        self.send(command)
+        return self.read_response()
+
+    def close(self):
+        self.send("exit")
+        self.process.wait()
+
+
+def benchmark(plies: int, seed: Optional[int] = None):
+    """Play random games against an engine process and time each command"""
+    random = Random(seed)
+    timings: Dict[str, List[float]] = {}
+
+    def timed(name: str, command: str) -> List[str]:
+        start = perf_counter()
+        response = engine.request(command)
+        timings.setdefault(name, []).append(perf_counter() - start)
+        return response
+
+    engine = EngineProcess()
+    try:
+        timed("info", "info")
+        timed("newgame", "newgame Base")
+        for _ in range(plies):
+            moves = timed("validmoves", "validmoves")[0].split(";")
+            if not moves or moves == [""]:
+                break
+            response = timed("play", f"play {random.choice(moves)}")
+            if not response[0].split(";")[1] == STATE_NAMES[GameState.IN_PROGRESS]:
+                break
+        timed("bestmove depth 1", "bestmove depth 1")
+        timed("undo", "undo")
+        # Time how quickly a long search gives way to the next command
+        engine.send("bestmove time 01:00:00")
+        timed("interrupted bestmove", "validmoves")
+        engine.read_response()
+        stats = engine.request("stats")
+    finally:
+        engine.close()
+
+    for name, samples in timings.items():
+        print(
+            f"{name}: n={len(samples)} median={1000 * median(samples):.2f}ms"
+            f" p99={1000 * percentile(samples, 0.99):.2f}ms"
+        )
+    print(*stats)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--bench", action="store_true", help="benchmark protocol round trips"
+    )
+    parser.add_argument("--plies", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.plies, args.seed)
+    else:
+        Engine().run()
+
+
+if __name__ == "__main__":
+    main()
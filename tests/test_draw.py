@@ -0,0 +1,73 @@
+from hive.draw import Draw, Viewport, hexagon_stacks
+from hive.hex import Location
+from hive.hive import Hive
+from math import sqrt
+from random import Random
+
+import pytest
+
+
+def viewports(num_viewports: int, seed: int = 0):
+    random = Random(seed)
+    for _ in range(num_viewports):
+        width, height = random.randint(1, 400), random.randint(1, 400)
+        yield Viewport(
+            (random.uniform(-300, 700), random.uniform(-300, 700)),
+            random.uniform(5, 60),
+            width,
+            height,
+        )
+
+
+def overlaps_screen(location: Location, viewport: Viewport) -> bool:
+    """Whether the bounding box of the hex at the location touches the screen"""
+    center_x, center_y = viewport.center
+    x, y = location.to_pixel
+    x = viewport.radius * x + center_x
+    y = viewport.radius * y + center_y
+    half_width = sqrt(3) / 2 * viewport.radius
+    return (
+        -half_width <= x <= viewport.width + half_width
+        and -viewport.radius <= y <= viewport.radius + viewport.height
+    )
+
+
+def near_screen(location: Location, viewport: Viewport) -> bool:
+    """Whether the hex is within one row or column of the screen"""
+    center_x, center_y = viewport.center
+    x, y = location.to_pixel
+    x = viewport.radius * x + center_x
+    y = viewport.radius * y + center_y
+    margin = 3 * viewport.radius
+    return (
+        -margin <= x <= viewport.width + margin
+        and -margin <= y <= viewport.height + margin
+    )
+
+
+BOARD = list(hexagon_stacks(30))
+
+
+@pytest.mark.parametrize("viewport", list(viewports(50)))
+def test_culling_matches_brute_force(viewport):
+    visible = set(viewport.locations)
+    assert len(visible) == viewport.num_locations
+    for location in BOARD:
+        assert (location in viewport) == (location in visible)
+        if overlaps_screen(location, viewport):
+            assert location in viewport
+        if location in viewport:
+            assert near_screen(location, viewport)
+
+
+@pytest.mark.parametrize("size", [0, 3, 30])
+@pytest.mark.parametrize("viewport", list(viewports(10, seed=1)))
+def test_visible_stacks_scans_either_side(size, viewport):
+    # Small boards scan the occupied cells, large ones the visible cells
+    drawer = Draw(Hive.from_stacks(hexagon_stacks(size)))
+    expected = sorted(
+        id(hexes)
+        for location, hexes in drawer.hive.location_to_hex.items()
+        if location in viewport
+    )
+    assert sorted(id(hexes) for hexes in drawer.visible_stacks(viewport)) == expected
@@ -0,0 +1,102 @@
+from hive.fuzz import (
+    Failure,
+    Fuzzer,
+    _disagree,
+    _smaller_positions,
+    cached_generator,
+    is_connected,
+    outcome_at,
+    reference_generator,
+    shrink,
+)
+from hive.hex import Color, Location, Piece
+from hive.hive import Hive
+from time import perf_counter
+
+
+def drops_a_spider_move(hex):
+    locations = reference_generator(hex)
+    if hex.piece == Piece.SPIDER and locations:
+        locations.remove(min(locations, key=str))
+    return locations
+
+
+def test_wrong_moves_are_found_and_shrunk():
+    report = Fuzzer(drops_a_spider_move, seed=0, max_plies=20).run(games=3)
+    assert report.failures
+    failure = report.failures[0]
+    assert failure.expected != failure.actual
+    assert len(failure.stacks) <= 4
+
+
+def test_shrunk_failures_are_minimal():
+    stacks = {
+        Location(0, 0, 0): [(Piece.QUEEN, Color.WHITE)],
+        Location(1, -1, 0): [(Piece.QUEEN, Color.BLACK)],
+        Location(-1, 1, 0): [(Piece.ANT, Color.WHITE)],
+        Location(2, -2, 0): [(Piece.ANT, Color.BLACK)],
+        Location(-1, 0, 1): [(Piece.SPIDER, Color.WHITE)],
+        Location(2, -1, -1): [(Piece.GRASSHOPPER, Color.BLACK)],
+    }
+    location = Location(-1, 0, 1)
+    expected = outcome_at(reference_generator, Hive.from_stacks(stacks), location)
+    actual = outcome_at(drops_a_spider_move, Hive.from_stacks(stacks), location)
+    assert expected != actual
+    failure = shrink(
+        reference_generator,
+        drops_a_spider_move,
+        Failure(stacks, location, expected, actual),
+    )
+    assert len(failure.stacks) < len(stacks)
+    assert is_connected(failure.stacks)
+    assert _disagree(
+        reference_generator, drops_a_spider_move, failure.stacks, location
+    ) == (failure.expected, failure.actual)
+    for smaller in _smaller_positions(failure.stacks, location):
+        if is_connected(smaller):
+            assert _disagree(
+                reference_generator, drops_a_spider_move, smaller, location
+            ) is None
+
+
+def test_workers_play_the_same_games():
+    serial = Fuzzer(drops_a_spider_move, seed=1, max_plies=12).run(games=4)
+    parallel = Fuzzer(drops_a_spider_move, seed=1, max_plies=12).run(
+        games=4, workers=2
+    )
+    assert parallel.games == serial.games == 4
+    assert parallel.plies == serial.plies
+    assert parallel.comparisons == serial.comparisons
+    assert sorted(map(str, parallel.failures)) == sorted(map(str, serial.failures))
+
+
+def test_duration_is_checked_during_games():
+    start = perf_counter()
+    report = Fuzzer(cached_generator, seed=0, max_plies=10000).run(duration=0.5)
+    assert perf_counter() - start < 2
+    assert report.games == 0
+    assert report.plies > 0
+
+
+
+
+def test_cached_moves_match_the_reference_on_hits_and_misses():
+    report = Fuzzer(cached_generator, seed=0, max_plies=16).run(games=3)
+    assert not report.failures
+    assert report.cache_hits > 0
+    assert report.cache_misses > 0
+
+
+def test_answers_that_change_once_cached_are_found():
+    asked = set()
+
+    def candidate(hex):
+        locations = cached_generator(hex)
+        key = (hex.hive.zobrist_key, hex.location)
+        if key in asked:
+            locations.clear()
+        asked.add(key)
+        return locations
+
+    report = Fuzzer(candidate, seed=0, max_plies=30).run(games=5)
+    assert any(failure.actual[0] == "inconsistent" for failure in report.failures)
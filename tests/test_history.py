@@ -0,0 +1,40 @@
+from hive.history import GameTree, build_random_tree, dict_diff
+from random import Random
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def tree() -> GameTree:
+    return build_random_tree(150, Random(0))
+
+
+def test_to_stacks_matches_replaying_the_game(tree):
+    for node in tree:
+        assert node.to_stacks() == tree.game_at(node).hive.stacks
+
+
+def test_diff_matches_comparing_whole_positions(tree):
+    random = Random(1)
+    nodes = list(tree)
+    for _ in range(200):
+        a, b = random.choice(nodes), random.choice(nodes)
+        assert tree.diff(a, b) == dict_diff(a.to_labels(), b.to_labels())
+
+
+def test_diff_along_a_long_line_with_variations():
+    random = Random(2)
+    tree = GameTree()
+    line = [tree.root]
+    for _ in range(40):
+        line.append(tree.play(random.choice(tree.valid_moves(line[-1])), line[-1]))
+    # Variations branching from every tenth ply
+    variations = []
+    for node in line[::10]:
+        for _ in range(5):
+            node = tree.play(random.choice(tree.valid_moves(node)), node)
+        variations.append(node)
+    nodes = line + variations
+    for a in nodes:
+        for b in random.sample(nodes, 10) + [a]:
+            assert tree.diff(a, b) == dict_diff(a.to_labels(), b.to_labels())
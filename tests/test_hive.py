@@ -0,0 +1,47 @@
+from hive.hex import Color, Direction, Location, Piece
+from hive.hive import Hive
+from random import Random
+
+import pytest
+
+
+def random_stacks(random: Random, num_pieces: int):
+    """Pieces dropped near each other, not necessarily all touching"""
+    stacks = {}
+    location = Location(0, 0, 0)
+    for _ in range(num_pieces):
+        for _ in range(random.randint(1, 2)):
+            location = location + random.choice(list(Direction))
+        # Only beetles climb onto other pieces
+        piece = Piece.BEETLE if location in stacks else random.choice(list(Piece))
+        stacks.setdefault(location, []).append((piece, random.choice(list(Color))))
+    return stacks
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_is_connected_matches_connected_hexes(seed):
+    random = Random(seed)
+    hive = Hive.from_stacks(random_stacks(random, random.randint(1, 12)))
+    assert hive.is_connected == (hive.all_top_level_hexes == hive.connected_hexes)
+
+
+@pytest.mark.parametrize("gap", list(Direction))
+def test_gated_ant_has_no_moves_and_stays_put(gap):
+    # The ant can leave the hive without splitting it, but the only empty
+    # neighbor is too narrow to slide into
+    ant = Location(0, 0, 0)
+    stacks = {ant: [(Piece.ANT, Color.WHITE)]}
+    for direction in Direction:
+        if direction != gap:
+            stacks[ant + direction] = [(Piece.GRASSHOPPER, Color.BLACK)]
+    for cached in (False, True):
+        hive = Hive.from_stacks(stacks)
+        hex = hive.get_top_hex_by_location(ant)
+        assert hex.can_be_moved
+        assert not any(hex.can_move_in_direction(d) for d in Direction)
+        if cached:
+            assert hex.moveable_locations == set()
+        else:
+            assert hex.generate_moveable_locations() == set()
+        assert hex.location == ant
+        assert hive.stacks == stacks
@@ -0,0 +1,73 @@
+from hive.hex import Color, Location, Piece
+from hive.render import (
+    fit,
+    game_jobs,
+    parse_game_string,
+    random_position,
+    render,
+    render_batch,
+)
+from random import Random
+
+import os
+
+
+def test_parse_game_string():
+    stacks, error = parse_game_string("Base;InProgress;White[2];wA1;bS1 wA1-")
+    assert error is None
+    assert stacks == {
+        Location(0, 0, 0): [(Piece.ANT, Color.WHITE)],
+        Location(1, -1, 0): [(Piece.SPIDER, Color.BLACK)],
+    }
+
+
+def test_bad_game_strings_are_reported():
+    stacks, error = parse_game_string("Base;InProgress;White[2];wA1;bS1 wB1-")
+    assert stacks is None
+    assert "wB1" in error
+
+
+def test_illegal_moves_are_only_reported_when_validating():
+    game_string = "Base;InProgress;White[1];wQ"
+    stacks, error = parse_game_string(game_string)
+    assert error is None
+    stacks, error = parse_game_string(game_string, validate=True)
+    assert stacks is None
+    assert "wQ" in error
+
+
+def test_render_batch_streams_a_games_file(tmp_path):
+    games = tmp_path / "games.txt"
+    games.write_text(
+        "Base;InProgress;White[2];wA1;bS1 wA1-\n"
+        "\n"
+        "Base;InProgress;White[2];wA1;bS1 wB1-\n"
+        "Base;InProgress;Black[1];wA1\n"
+    )
+    report = render_batch(
+        game_jobs(str(games), str(tmp_path)), 32, 32, workers=2, chunksize=1
+    )
+    assert report.num_images == 2
+    assert report.skipped == [
+        (os.path.join(tmp_path, "000003.png"), "Piece 'wB1' is not on the board.")
+    ]
+    assert sorted(path.name for path in tmp_path.glob("*.png")) == [
+        "000001.png",
+        "000004.png",
+    ]
+
+
+def test_every_piece_fits_inside_the_image():
+    random = Random(0)
+    for _ in range(20):
+        stacks = random_position(random, 22)
+        (center_x, center_y), radius = fit(stacks, 256, 128, margin=4)
+        for location in stacks:
+            x, y = location.to_pixel
+            assert 4 <= center_x + radius * x <= 252
+            assert 4 <= center_y + radius * y <= 124
+
+
+def test_render_size():
+    surface = render(random_position(Random(0), 8), 64, 48)
+    assert surface.get_size() == (64, 48)
@@ -0,0 +1,251 @@
+from concurrent.futures import ThreadPoolExecutor
+from hive.game import Move
+from hive.hex import Location
+from hive.server import OPENING, Client, HiveServer
+
+import asyncio
+import json
+import pytest
+
+
+def serve(scenario):
+    """Run a scenario against a server on a free port with an in-process pool"""
+
+    async def run():
+        with ThreadPoolExecutor(1) as executor:
+            server = HiveServer(executor)
+            tcp_server = await server.start()
+            host, port = tcp_server.sockets[0].getsockname()[:2]
+            async with tcp_server:
+                client = await Client.connect(host, port)
+                try:
+                    await scenario(server, client)
+                finally:
+                    await client.close()
+                await server.wait_for_connections()
+
+    asyncio.run(run())
+
+
+async def new_game(client: Client, placements=()) -> int:
+    game = (await client.request("new"))["game"]
+    for piece, color, location in placements:
+        response = await client.request(
+            "place", game=game, piece=piece.name, color=color.name, location=location
+        )
+        assert response["ok"], response
+    return game
+
+
+def place(client: Client, game: int, piece: str, color: str, location):
+    return client.request(
+        "place", game=game, piece=piece, color=color, location=location
+    )
+
+
+def test_game_lifecycle():
+    async def scenario(server, client):
+        game = await new_game(client, OPENING)
+        state = await client.request("state", game=game)
+        assert state["ok"]
+        assert state["turn"] == "WHITE"
+        assert state["state"] == "IN_PROGRESS"
+        assert state["num_moves"] == len(OPENING)
+        assert [[0, 0, 0], [["ANT", "WHITE"]]] in state["stacks"]
+
+        # The white queen, free to slide around the ant it is next to
+        queen = [-1, 1, 0]
+        moves = await client.request("moves", game=game, location=queen)
+        assert moves["ok"]
+        assert moves["locations"]
+        destination = sorted(moves["locations"])[0]
+        move = await client.request(
+            "move", game=game, **{"from": queen, "to": destination}
+        )
+        assert move == {"ok": True, "id": move["id"]}
+        state = await client.request("state", game=game)
+        assert state["turn"] == "BLACK"
+        assert [destination, [["QUEEN", "WHITE"]]] in state["stacks"]
+
+        stats = await client.request("stats")
+        assert stats["games"] == 1
+        assert stats["validations"] == 1
+        assert stats["mean_game_bytes"] > 0
+        assert 0 <= stats["move_cache_hit_rate"] <= 1
+
+        assert (await client.request("close", game=game))["ok"]
+        assert not (await client.request("state", game=game))["ok"]
+
+    serve(scenario)
+
+
+@pytest.mark.parametrize(
+    "placements, error",
+    [
+        # Black placing first
+        ([("ANT", "BLACK", [0, 0, 0])], "turn"),
+        ([("QUEEN", "WHITE", [0, 0, 0])], "QUEEN"),
+        # The first piece goes at the origin
+        ([("ANT", "WHITE", [1, -1, 0])], "cannot place"),
+        # White's third piece touching a black one
+        (
+            [
+                ("ANT", "WHITE", [0, 0, 0]),
+                ("ANT", "BLACK", [1, -1, 0]),
+                ("ANT", "WHITE", [2, -2, 0]),
+            ],
+            "cannot place",
+        ),
+        # A fourth piece that is not the queen
+        (
+            [
+                ("ANT", "WHITE", [0, 0, 0]),
+                ("ANT", "BLACK", [1, -1, 0]),
+                ("ANT", "WHITE", [-1, 1, 0]),
+                ("ANT", "BLACK", [2, -2, 0]),
+                ("ANT", "WHITE", [-2, 2, 0]),
+                ("ANT", "BLACK", [3, -3, 0]),
+                ("SPIDER", "WHITE", [-3, 3, 0]),
+            ],
+            "cannot place",
+        ),
+        # More ants than the hand holds
+        (
+            [
+                ("ANT", "WHITE", [0, 0, 0]),
+                ("ANT", "BLACK", [1, -1, 0]),
+                ("QUEEN", "WHITE", [-1, 1, 0]),
+                ("QUEEN", "BLACK", [2, -2, 0]),
+                ("ANT", "WHITE", [-2, 2, 0]),
+                ("ANT", "BLACK", [3, -3, 0]),
+                ("ANT", "WHITE", [-3, 3, 0]),
+                ("ANT", "BLACK", [4, -4, 0]),
+                ("ANT", "WHITE", [-4, 4, 0]),
+            ],
+            "cannot place ANT",
+        ),
+    ],
+)
+def test_illegal_placements(placements, error):
+    async def scenario(server, client):
+        game = await new_game(client)
+        *legal, (piece, color, location) = placements
+        for args in legal:
+            assert (await place(client, game, *args))["ok"]
+        response = await place(client, game, piece, color, location)
+        assert not response["ok"]
+        assert error in response["error"]
+
+    serve(scenario)
+
+
+def test_moving_before_the_queen_is_down():
+    async def scenario(server, client):
+        game = await new_game(client)
+        for args in [
+            ("ANT", "WHITE", [0, 0, 0]),
+            ("ANT", "BLACK", [1, -1, 0]),
+            ("ANT", "WHITE", [-1, 1, 0]),
+            ("ANT", "BLACK", [2, -2, 0]),
+        ]:
+            assert (await place(client, game, *args))["ok"]
+        response = await client.request(
+            "move", game=game, **{"from": [-1, 1, 0], "to": [0, 1, -1]}
+        )
+        assert not response["ok"]
+        assert "queen" in response["error"]
+
+    serve(scenario)
+
+
+def test_moving_to_an_illegal_location():
+    async def scenario(server, client):
+        game = await new_game(client, OPENING)
+        response = await client.request(
+            "move", game=game, **{"from": [-1, 1, 0], "to": [5, -5, 0]}
+        )
+        assert not response["ok"]
+        assert "cannot move" in response["error"]
+        # Black's pieces cannot move on white's turn
+        response = await client.request(
+            "move", game=game, **{"from": [2, -2, 0], "to": [3, -3, 0]}
+        )
+        assert not response["ok"]
+        assert "turn" in response["error"]
+
+    serve(scenario)
+
+
+def play(server: HiveServer, game: int, moves):
+    hosted = server.games[game]
+    for label, (x, y, z) in moves:
+        hosted.game.play(Move(label, Location(x, y, z)), check=False)
+    hosted.measure()
+
+
+# The white queen with black pieces on five sides, so that white has nothing to
+# place and its queen cannot squeeze out through the sixth
+BOXED_IN = [
+    ("wQ", (0, 0, 0)),
+    ("bQ", (1, -1, 0)),
+    ("bA1", (1, 0, -1)),
+    ("bA2", (0, 1, -1)),
+    ("bA3", (-1, 1, 0)),
+    ("bS1", (-1, 0, 1)),
+]
+
+
+def test_passing():
+    async def scenario(server, client):
+        game = await new_game(client, OPENING)
+        response = await client.request("pass", game=game)
+        assert not response["ok"]
+        assert "has moves" in response["error"]
+
+        game = await new_game(client)
+        play(server, game, BOXED_IN)
+        assert (await client.request("pass", game=game))["ok"]
+        assert (await client.request("state", game=game))["turn"] == "BLACK"
+
+    serve(scenario)
+
+
+def test_nothing_is_played_once_the_game_is_over():
+    async def scenario(server, client):
+        game = await new_game(client)
+        play(server, game, BOXED_IN + [("bS2", (0, -1, 1)), ("wA1", (-1, -1, 2))])
+        state = await client.request("state", game=game)
+        assert state["state"] == "BLACK_WINS"
+        for op, kwargs in [
+            ("place", {"piece": "ANT", "color": "BLACK", "location": [2, -2, 0]}),
+            ("move", {"from": [0, -1, 1], "to": [1, -2, 1]}),
+            ("pass", {}),
+        ]:
+            response = await client.request(op, game=game, **kwargs)
+            assert not response["ok"]
+            assert "over" in response["error"]
+
+    serve(scenario)
+
+
+def test_bad_requests():
+    async def scenario(server, client):
+        for line in [b"{not json\n", b"[1, 2]\n"]:
+            client.writer.write(line)
+            response = json.loads(await client.reader.readline())
+            assert not response["ok"]
+            assert "Malformed" in response["error"]
+        response = await client.request("fly")
+        assert not response["ok"]
+        assert "Unknown operation" in response["error"]
+        response = await client.request("state", game=12345)
+        assert not response["ok"]
+        assert "No game" in response["error"]
+        game = await new_game(client)
+        response = await client.request("moves", game=game, location=[1e400, 0, 0])
+        assert not response["ok"]
+        assert "Invalid location" in response["error"]
+        # The connection is still usable after every error
+        assert (await client.request("stats"))["ok"]
+
+    serve(scenario)
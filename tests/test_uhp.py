@@ -0,0 +1,134 @@
+from hive.game import ORIGIN, PASS, Game, Move
+from hive.hex import Direction
+from hive.uhp import Engine, InvalidMove, format_move, parse_move
+from io import StringIO
+from random import Random
+
+import hive.uhp
+import pytest
+
+
+def random_games(num_games: int, plies: int, seed: int = 0):
+    """Positions along random games, one game and ply at a time"""
+    random = Random(seed)
+    for _ in range(num_games):
+        game = Game()
+        for _ in range(plies):
+            yield game
+            if game.is_over:
+                break
+            game.play(random.choice(game.valid_moves()))
+
+
+def test_first_move_needs_no_position():
+    game = Game()
+    assert parse_move(game, "wA1") == Move("wA1", ORIGIN)
+    assert format_move(game, Move("wA1", ORIGIN)) == "wA1"
+
+
+def test_pass():
+    assert parse_move(Game(), "pass") == PASS
+    assert format_move(Game(), PASS) == "pass"
+
+
+@pytest.mark.parametrize(
+    "position, direction",
+    [
+        ("wA1-", Direction.RIGHT),
+        ("-wA1", Direction.LEFT),
+        ("wA1/", Direction.UP_RIGHT),
+        ("/wA1", Direction.DOWN_LEFT),
+        ("\\wA1", Direction.UP_LEFT),
+        ("wA1\\", Direction.DOWN_RIGHT),
+    ],
+)
+def test_relative_positions(position, direction):
+    game = Game()
+    game.play(Move("wA1", ORIGIN))
+    move = parse_move(game, f"bA1 {position}")
+    assert move == Move("bA1", ORIGIN + direction)
+    assert format_move(game, move) == f"bA1 {position}"
+
+
+def test_beetle_on_top_is_written_against_the_piece_beneath():
+    game = Game()
+    game.play(Move("wB1", ORIGIN), check=False)
+    game.play(Move("bB1", ORIGIN + Direction.RIGHT), check=False)
+    move = parse_move(game, "bB1 wB1")
+    assert move == Move("bB1", ORIGIN)
+    assert format_move(game, move) == "bB1 wB1"
+
+
+@pytest.mark.parametrize("move_string", ["wA1", "bA1 wS1-", "bA1 wA1 wA2"])
+def test_invalid_moves(move_string):
+    game = Game()
+    game.play(Move("wA1", ORIGIN))
+    with pytest.raises(InvalidMove):
+        parse_move(game, move_string)
+
+
+def test_every_valid_move_round_trips():
+    for game in random_games(num_games=5, plies=24):
+        for move in game.valid_moves():
+            assert parse_move(game, format_move(game, move)) == move
+
+
+def test_bare_bestmove_answers_after_the_default_time(monkeypatch):
+    monkeypatch.setattr(hive.uhp, "DEFAULT_SEARCH_TIME", 0.1)
+    output = StringIO()
+    engine = Engine(output)
+    engine.execute("newgame Base;InProgress;Black[1];wA1")
+    engine.execute("bestmove")
+    engine.search_thread.join(timeout=10)
+    assert not engine.search_thread.is_alive()
+    lines = output.getvalue().splitlines()
+    assert lines[-1] == "ok"
+    assert lines[-2].startswith("b")
+
+
+def test_stats_reports_the_move_cache():
+    output = StringIO()
+    engine = Engine(output)
+    engine.execute("newgame Base;InProgress;White[3];wA1;bA1 wA1-;wQ -wA1;bQ bA1-")
+    # Moves are generated once, by whichever of the warm up and validmoves
+    # gets to each hex first, and read from the cache by the other
+    engine.execute("validmoves")
+    engine.search_thread.join()
+    engine.execute("stats")
+    stats = output.getvalue().splitlines()[-2]
+    assert stats.startswith("movecache ")
+    fields = dict(field.split("=") for field in stats.split()[1:])
+    assert int(fields["hits"]) > 0
+    assert int(fields["misses"]) > 0
+
+
+@pytest.mark.parametrize(
+    "game_string",
+    [
+        "Base;BlackWins;White[9];wA1",
+        "Base;InProgress;White[1];wA1",
+        "Base;NotStarted;Black[1];wA1",
+        "Base;InProgress;White[1]",
+    ],
+)
+def test_newgame_rejects_a_state_or_turn_its_moves_contradict(game_string):
+    output = StringIO()
+    engine = Engine(output)
+    engine.execute(f"newgame {game_string}")
+    assert output.getvalue().splitlines()[0].startswith("err ")
+    assert engine.game is None
+
+
+@pytest.mark.parametrize(
+    "game_string",
+    [
+        "Base;NotStarted;White[1]",
+        "Base;InProgress;Black[1];wA1",
+        "Base;InProgress;White[2];wA1;bA1 wA1-",
+    ],
+)
+def test_newgame_accepts_consistent_game_strings(game_string):
+    output = StringIO()
+    engine = Engine(output)
+    engine.execute(f"newgame {game_string}")
+    assert output.getvalue().splitlines()[0] == game_string